@@ -5,6 +5,7 @@ HTML to Markdown 转换模块
 将 index.html 热点新闻报告转换为 Hugo frontmatter 格式的 Markdown 文件
 """
 
+import os
 import re
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -12,6 +13,41 @@ from datetime import datetime
 from html.parser import HTMLParser
 
 
+# 预编译正则，避免每次调用重复查找模式缓存
+_DIGITS_RE = re.compile(r'(\d+)')
+_GENERATE_TIME_RE = re.compile(r'(\d{2})-(\d{2})\s+(\d{2}):(\d{2})')
+
+
+class _FilenameCharTable(dict):
+    """
+    sanitize_filename 使用的 str.translate 映射表
+
+    保留 CJK 基本区、ASCII 字母数字、空白和连字符，其余字符删除；
+    首次遇到某字符时判定一次并缓存结果
+    """
+
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        ch = chr(codepoint)
+        keep = (
+            '\u4e00' <= ch <= '\u9fa5'
+            or (ch.isascii() and ch.isalnum())
+            or ch == '-'
+            or ch.isspace()
+        )
+        value = codepoint if keep else None
+        self[codepoint] = value
+        return value
+
+
+_FNAME_TABLE = _FilenameCharTable()
+
+# frontmatter 固定标签与分类，模块加载时格式化一次
+_FRONTMATTER_TAGS: Tuple[str, ...] = ("trend", "news", "热点")
+_FRONTMATTER_CATEGORIES: Tuple[str, ...] = ("news",)
+_TAGS_STR = ', '.join(f'"{tag}"' for tag in _FRONTMATTER_TAGS)
+_CATEGORIES_STR = ', '.join(f'"{cat}"' for cat in _FRONTMATTER_CATEGORIES)
+
+
 class NewsHTMLParser(HTMLParser):
     """解析新闻 HTML 报告"""
     
@@ -220,11 +256,11 @@ class NewsHTMLParser(HTMLParser):
             if self._current_label == "报告类型":
                 self.report_type = data
             elif self._current_label == "新闻总数":
-                match = re.search(r'(\d+)', data)
+                match = _DIGITS_RE.search(data)
                 if match:
                     self.news_count = int(match.group(1))
             elif self._current_label == "热点新闻":
-                match = re.search(r'(\d+)', data)
+                match = _DIGITS_RE.search(data)
                 if match:
                     self.hot_count = int(match.group(1))
             elif self._current_label == "生成时间":
@@ -234,7 +270,7 @@ class NewsHTMLParser(HTMLParser):
         elif self._in_word_name and self.current_group:
             self.current_group['name'] = data
         elif self._in_word_count and self.current_group:
-            match = re.search(r'(\d+)', data)
+            match = _DIGITS_RE.search(data)
             if match:
                 self.current_group['count'] = int(match.group(1))
         elif self._in_word_index and self.current_group:
@@ -296,7 +332,7 @@ def parse_generate_time(time_str: str) -> Tuple[str, str]:
     current_year = now.year
     
     # 尝试解析 MM-DD HH:MM 格式
-    match = re.match(r'(\d{2})-(\d{2})\s+(\d{2}):(\d{2})', time_str)
+    match = _GENERATE_TIME_RE.match(time_str)
     if match:
         month, day, hour, minute = match.groups()
         date_str = f"{current_year}-{month}-{day}"
@@ -320,8 +356,8 @@ def sanitize_filename(text: str, max_length: int = 50) -> str:
     Returns:
         清理后的文件名
     """
-    cleaned = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s-]', '', text)
-    cleaned = re.sub(r'\s+', '-', cleaned.strip())
+    # 单次 translate 删除非法字符，split/join 同时完成去首尾空白与空白折叠
+    cleaned = '-'.join(text.translate(_FNAME_TABLE).split())
     if len(cleaned) > max_length:
         cleaned = cleaned[:max_length]
     return cleaned
@@ -370,18 +406,12 @@ def format_frontmatter(date: str, title: str, description: str = "") -> str:
     Returns:
         frontmatter 字符串
     """
-    tags = ["trend", "news", "热点"]
-    categories = ["news"]
-    
-    tags_str = ', '.join(f'"{tag}"' for tag in tags)
-    categories_str = ', '.join(f'"{cat}"' for cat in categories)
-    
     frontmatter = f'''+++
 date = "{date}"
 title = "{title}"
 description = "{description}"
-tags = [{tags_str}]
-categories = [{categories_str}]
+tags = [{_TAGS_STR}]
+categories = [{_CATEGORIES_STR}]
 +++
 '''
     return frontmatter
@@ -401,25 +431,20 @@ def format_word_group(group: Dict) -> str:
     count = group.get('count', 0)
     news_list = group.get('news', [])
     
-    section = f"## {name} ({count}条)\n\n"
+    parts = [f"## {name} ({count}条)\n\n"]
     
     for news in news_list:
         title = news.get('title', '')
         url = news.get('url', '')
         source = news.get('source', '')
         
-        if url:
-            section += f"- [{title}]({url})"
-        else:
-            section += f"- {title}"
-        
+        item = f"- [{title}]({url})" if url else f"- {title}"
         if source:
-            section += f" - 来源: {source}"
-        
-        section += "\n"
+            item = f"{item} - 来源: {source}"
+        parts.append(f"{item}\n")
     
-    section += "\n"
-    return section
+    parts.append("\n")
+    return ''.join(parts)
 
 
 def convert_html_to_markdown(
@@ -493,52 +518,57 @@ def convert_html_to_markdown(
     description = f"基于{date_str}的热点新闻汇总"
     
     # 组装 Markdown 内容
-    content = format_frontmatter(date_str, title, description)
-    content += "\n# 热词统计\n\n"
-    content += f"*生成时间: {generate_time}*\n\n"
+    parts = [
+        format_frontmatter(date_str, title, description),
+        "\n# 热词统计\n\n",
+        f"*生成时间: {generate_time}*\n\n",
+    ]
     
     # 添加每个热词分组
     total_news = 0
     for group in word_groups[:max_keywords]:
-        content += format_word_group(group)
+        parts.append(format_word_group(group))
         total_news += len(group.get('news', []))
     
     # 添加页脚
-    content += "\n---\n\n"
+    parts.append("\n---\n\n")
     
     # 收集来源
-    sources = set()
-    for group in word_groups:
-        for news in group.get('news', []):
-            source = news.get('source', '')
-            if source:
-                sources.add(source)
+    sources = {
+        news['source']
+        for group in word_groups
+        for news in group.get('news', ())
+        if news.get('source')
+    }
     
     sources_list = list(sources)[:5]
     if sources_list:
         sources_str = '、'.join(sources_list)
         if len(sources) > 5:
             sources_str += '等'
-        content += f"*数据来源: {sources_str} | 日期: {date_str}*\n"
+        parts.append(f"*数据来源: {sources_str} | 日期: {date_str}*\n")
     else:
-        content += f"*日期: {date_str}*\n"
+        parts.append(f"*日期: {date_str}*\n")
     
-    # 写入文件
+    # 写入文件：先写同目录临时文件再原子替换，避免 Hugo 读到半截文件
+    tmp_path = file_path.with_name(f".{filename}.{os.getpid()}.tmp")
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        with open(tmp_path, 'w', encoding='utf-8', buffering=65536) as f:
+            f.writelines(parts)
+        os.replace(tmp_path, file_path)
         print(f"[HTML转Markdown] 成功生成: {file_path}")
         print(f"[HTML转Markdown] 统计: {len(word_groups[:max_keywords])} 个热词, {total_news} 条新闻")
         return str(file_path)
     except Exception as e:
         print(f"[HTML转Markdown] 写入失败: {e}")
         return None
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
 
 
 def main():
     """主函数 - 转换 root/index.html 到 page/src/content/post/{category}/{year}/{month}/"""
-    import os
-    
     # 获取脚本所在目录
     script_dir = Path(__file__).parent.resolve()
     
@@ -15,6 +15,7 @@ import time
 import yaml
 import logging
 from datetime import date
+from types import MappingProxyType
 from typing import Dict, List, Optional, Tuple, Any
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -26,11 +27,22 @@ from ai_analysis.functions.market_data import MarketDataProvider
 from ai_analysis.functions.technical import TechnicalAnalyzer
 from ai_analysis.prompts import PromptTemplates
 
+# anthropic 可选导入
+try:
+    from anthropic import Anthropic
+    HAS_ANTHROPIC = True
+except ImportError:
+    HAS_ANTHROPIC = False
+    Anthropic = None
+
 # Claude 模型配置（从环境变量获取，默认使用 claude-sonnet-4-20250514）
 ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
 
 logger = logging.getLogger(__name__)
 
+# 只读空字典，作为结果字段缺失时的共享默认值（避免每次 .get(..., {}) 新建字典）
+_EMPTY = MappingProxyType({})
+
 
 def load_stock_map_from_config(
     config_path: str = "config/analysis.yaml",
@@ -74,6 +86,23 @@ def load_stock_map_from_config(
         return {}
 
 
+def _markdown_table(headers: List[str], rows: List[Tuple[Any, ...]], aligns: List[str]) -> str:
+    """
+    一次性生成 Markdown 表格
+    
+    Args:
+        headers: 表头
+        rows: 行数据（每行为与表头等长的元组）
+        aligns: 对齐分隔符，如 ":----:"
+        
+    Returns:
+        Markdown 表格文本（以换行结尾）
+    """
+    lines = ["| " + " | ".join(headers) + " |", "|" + "|".join(aligns) + "|"]
+    lines.extend("| " + " | ".join(map(str, row)) + " |" for row in rows)
+    return "\n".join(lines) + "\n"
+
+
 class StockAnalysisPipeline:
     """
     股票分析主流程调度器
@@ -108,6 +137,12 @@ class StockAnalysisPipeline:
         # 初始化存储管理器
         self.storage = get_stock_storage_manager(backend_type="auto")
         
+        # Anthropic 客户端（首次调用时创建，之后复用）
+        self._anthropic = None
+        
+        # 本次运行日期（run() 开始时确定，避免跨零点前后不一致）
+        self._run_date: Optional[date] = None
+        
         logger.info(f"调度器初始化完成，最大并发数: {self.max_workers}，映射类型: {map_type}")
         logger.info(f"股票列表: {self.stock_map}")
     
@@ -115,7 +150,8 @@ class StockAnalysisPipeline:
         self, 
         code: str,
         market: str = "CN-A",
-        force_refresh: bool = False
+        force_refresh: bool = False,
+        today: Optional[date] = None
     ) -> Tuple[bool, Optional[str]]:
         """
         获取并保存单只股票数据
@@ -129,12 +165,13 @@ class StockAnalysisPipeline:
             code: 股票代码
             market: 市场类型 (CN-A / US / HK)
             force_refresh: 是否强制刷新（忽略本地缓存）
+            today: 数据日期（默认使用本次运行日期）
             
         Returns:
             Tuple[是否成功, 错误信息]
         """
         try:
-            today = date.today()
+            today = today or self._run_date or date.today()
             
             # 断点续传检查：如果今日数据已存在，跳过
             if not force_refresh and self.storage.has_today_data(code, today):
@@ -187,7 +224,12 @@ class StockAnalysisPipeline:
             logger.error(f"[{code}] {error_msg}")
             return False, error_msg
     
-    def analyze_stock(self, code: str, market: str = "CN-A") -> Optional[Dict[str, Any]]:
+    def analyze_stock(
+        self,
+        code: str,
+        market: str = "CN-A",
+        today: Optional[date] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         分析单只股票
         
@@ -200,15 +242,17 @@ class StockAnalysisPipeline:
         Args:
             code: 股票代码
             market: 市场类型
+            today: 分析日期（默认使用本次运行日期）
             
         Returns:
             分析结果字典 或 None（如果分析失败）
         """
         try:
+            today = today or self._run_date or date.today()
             result = {
                 "code": code,
                 "market": market,
-                "timestamp": date.today().isoformat()
+                "timestamp": today.isoformat()
             }
             
             # Step 1: 获取实时行情
@@ -260,8 +304,11 @@ class StockAnalysisPipeline:
             return result
             
         except Exception as e:
-            logger.error(f"[{code}] 分析失败: {e}")
-            logger.exception(f"[{code}] 详细错误信息:")
+            # 仅在 DEBUG 级别输出完整堆栈，避免批量运行时重复格式化 traceback
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.exception(f"[{code}] 分析失败: {e}")
+            else:
+                logger.error(f"[{code}] 分析失败: {type(e).__name__}: {e}")
             return None
     
     def process_single_stock(
@@ -319,7 +366,10 @@ class StockAnalysisPipeline:
             return result
             
         except Exception as e:
-            logger.exception(f"[{code}] 处理过程发生未知异常: {e}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.exception(f"[{code}] 处理过程发生未知异常: {e}")
+            else:
+                logger.error(f"[{code}] 处理过程发生未知异常: {type(e).__name__}: {e}")
             return None
     
     def run(
@@ -342,6 +392,7 @@ class StockAnalysisPipeline:
             分析结果列表
         """
         start_time = time.time()
+        self._run_date = date.today()
         
         # 使用配置中的股票列表
         if stock_codes is None:
@@ -397,7 +448,7 @@ class StockAnalysisPipeline:
         """
         from datetime import timedelta
         
-        today = date.today()
+        today = self._run_date or date.today()
         start_date = (today - timedelta(days=days)).strftime("%Y-%m-%d")
         end_date = today.strftime("%Y-%m-%d")
         
@@ -423,6 +474,23 @@ class StockAnalysisPipeline:
             logger.warning(f"[{code}] 获取原始 K 线数据失败: {e}")
             return []
 
+    def _get_anthropic_client(self, api_key: str):
+        """
+        获取 Anthropic 客户端（懒加载，整个调度器生命周期内复用）
+        
+        Args:
+            api_key: Anthropic API 密钥
+            
+        Returns:
+            Anthropic 客户端实例
+        """
+        if not HAS_ANTHROPIC:
+            raise ImportError("anthropic 未安装，请运行: pip install anthropic")
+        
+        if self._anthropic is None:
+            self._anthropic = Anthropic(api_key=api_key, max_retries=2)
+        return self._anthropic
+
     def get_ai_single_stock_analysis(
         self,
         stock_result: Dict[str, Any],
@@ -443,8 +511,7 @@ class StockAnalysisPipeline:
             return "> ⚠️ 未设置 ANTHROPIC_API_KEY，跳过 AI 分析"
         
         try:
-            from anthropic import Anthropic
-            client = Anthropic(api_key=api_key)
+            client = self._get_anthropic_client(api_key)
             
             code = stock_result.get("code", "")
             name = stock_result.get("name", "")
@@ -454,10 +521,10 @@ class StockAnalysisPipeline:
             raw_kline = self._get_raw_kline_data(code, days=15)
             
             # 构建精简数据
-            realtime = stock_result.get("realtime", {})
-            trend_score = stock_result.get("trend_score", {})
-            ma_alignment = stock_result.get("ma_alignment", {})
-            chip = stock_result.get("chip", {})
+            realtime = stock_result.get("realtime") or _EMPTY
+            trend_score = stock_result.get("trend_score") or _EMPTY
+            ma_alignment = stock_result.get("ma_alignment") or _EMPTY
+            chip = stock_result.get("chip") or _EMPTY
             
             # K 线摘要（最近 5 天）
             kline_summary = ""
@@ -551,8 +618,7 @@ class StockAnalysisPipeline:
             return {"title": "", "content": "\n> ⚠️ 未设置 ANTHROPIC_API_KEY，跳过 AI 分析\n"}
         
         try:
-            from anthropic import Anthropic
-            client = Anthropic(api_key=api_key)
+            client = self._get_anthropic_client(api_key)
             
             # 构建增强版数据包：原始数据 + 技术指标参考
             enhanced_data = []
@@ -721,16 +787,21 @@ tags = {tags}
 '''
         
         content += "## 📊 分析摘要\n\n"
-        content += "| 股票 | 名称 | 市场 | 评分 | 信号 |\n"
-        content += "|:----:|:----:|:----:|:----:|:----:|\n"
-        
+        summary_rows = []
         for r in results:
-            code = r.get("code", "")
-            name = r.get("name", "")
-            market = r.get("market", "")
-            score = r.get("trend_score", {}).get("total_score", 0)
-            signal = r.get("trend_score", {}).get("signal", "N/A")
-            content += f"| {code} | {name} | {market} | {score} | {signal} |\n"
+            ts = r.get("trend_score") or _EMPTY
+            summary_rows.append((
+                r.get("code", ""),
+                r.get("name", ""),
+                r.get("market", ""),
+                ts.get("total_score", 0),
+                ts.get("signal", "N/A"),
+            ))
+        content += _markdown_table(
+            ["股票", "名称", "市场", "评分", "信号"],
+            summary_rows,
+            [":----:"] * 5,
+        )
         
         content += "\n---\n\n"
         
@@ -743,7 +814,7 @@ tags = {tags}
             content += f"## 📈 {name} ({code})\n\n"
             
             # 实时行情
-            realtime = r.get("realtime", {})
+            realtime = r.get("realtime") or _EMPTY
             if realtime:
                 content += "### 实时行情\n\n"
                 content += "| 指标 | 数值 |\n"
@@ -757,16 +828,14 @@ tags = {tags}
                 content += "\n"
             
             # 趋势评分
-            trend_score = r.get("trend_score", {})
+            trend_score = r.get("trend_score") or _EMPTY
             if trend_score and "error" not in trend_score:
                 content += "### 趋势评分\n\n"
                 content += f"**综合评分: {trend_score.get('total_score', 0)}/100** {trend_score.get('signal', '')}\n\n"
                 
                 # 评分明细
-                breakdown = trend_score.get("breakdown", {})
+                breakdown = trend_score.get("breakdown") or _EMPTY
                 if breakdown:
-                    content += "| 维度 | 得分 | 状态 |\n"
-                    content += "|:----:|:----:|:----:|\n"
                     dimension_names = {
                         "ma_alignment": "均线排列",
                         "bias": "乖离率",
@@ -774,28 +843,40 @@ tags = {tags}
                         "rsi": "RSI",
                         "macd": "MACD"
                     }
-                    for key, data in breakdown.items():
-                        dim_name = dimension_names.get(key, key)
-                        s = data.get("score", 0)
-                        status = str(data.get("status", data.get("value", "")))[:20]
-                        content += f"| {dim_name} | {s} | {status} |\n"
+                    content += _markdown_table(
+                        ["维度", "得分", "状态"],
+                        [
+                            (
+                                dimension_names.get(key, key),
+                                data.get("score", 0),
+                                str(data.get("status", data.get("value", "")))[:20],
+                            )
+                            for key, data in breakdown.items()
+                        ],
+                        [":----:"] * 3,
+                    )
                     content += "\n"
                 
                 # 检查清单
                 checklist = trend_score.get("checklist", [])
                 if checklist:
                     content += "### 检查清单\n\n"
-                    content += "| 检查项 | 状态 | 数值 |\n"
-                    content += "|:------:|:----:|:----:|\n"
-                    for item in checklist:
-                        status = item.get("status", "⚠️")
-                        item_name = item.get("name", "")
-                        value = str(item.get("value", ""))[:25]
-                        content += f"| {item_name} | {status} | {value} |\n"
+                    content += _markdown_table(
+                        ["检查项", "状态", "数值"],
+                        [
+                            (
+                                item.get("name", ""),
+                                item.get("status", "⚠️"),
+                                str(item.get("value", ""))[:25],
+                            )
+                            for item in checklist
+                        ],
+                        [":------:", ":----:", ":----:"],
+                    )
                     content += "\n"
             
             # 均线排列
-            ma_alignment = r.get("ma_alignment", {})
+            ma_alignment = r.get("ma_alignment") or _EMPTY
             if ma_alignment and "error" not in ma_alignment:
                 content += "### 均线排列分析\n\n"
                 content += f"- 排列状态: **{ma_alignment.get('alignment', 'N/A')}**\n"
@@ -806,7 +887,7 @@ tags = {tags}
                 content += f"- 建议: {ma_alignment.get('trading_advice', '')}\n\n"
             
             # 筹码分布（仅A股）
-            chip = r.get("chip", {})
+            chip = r.get("chip") or _EMPTY
             if chip and "error" not in chip:
                 content += "### 筹码分布\n\n"
                 content += f"- 获利比例: {chip.get('profit_ratio', 0):.1%}\n"
@@ -965,8 +1046,9 @@ def main():
         if results:
             print("\n===== 分析结果摘要 =====")
             for r in results:
-                signal = r.get("trend_score", {}).get("signal", "N/A")
-                score = r.get("trend_score", {}).get("total_score", 0)
+                ts = r.get("trend_score") or _EMPTY
+                signal = ts.get("signal", "N/A")
+                score = ts.get("total_score", 0)
                 has_ai = "🤖" if r.get("ai_analysis") else ""
                 print(f"  {r.get('code')} ({r.get('name')}): {signal} (评分: {score}) {has_ai}")
             
@@ -12,9 +12,13 @@ A股自选股智能分析系统 - 存储模块
 
 from storage.base import (
     StockStorageBackend,
+    SQLiteBackendMixin,
     StockDaily,
+    StockDailyBatch,
     convert_dataframe_to_stock_daily_list,
     convert_stock_daily_list_to_dataframe,
+    encode_stock_daily_list,
+    decode_stock_daily_list,
 )
 from storage.stock import StockStorage, get_stock_storage, close_stock_storage
 from storage.manager import (
@@ -34,11 +38,16 @@ except ImportError:
 __all__ = [
     # 抽象基类
     "StockStorageBackend",
+    "SQLiteBackendMixin",
     # 数据模型
     "StockDaily",
+    "StockDailyBatch",
     # 转换函数
     "convert_dataframe_to_stock_daily_list",
     "convert_stock_daily_list_to_dataframe",
+    # 序列化函数
+    "encode_stock_daily_list",
+    "decode_stock_daily_list",
     # 本地存储
     "StockStorage",
     "get_stock_storage",
@@ -7,15 +7,164 @@ A股自选股智能分析系统 - 存储后端抽象基类
 定义统一的存储接口，所有存储后端都需要实现这些方法
 """
 
+import json
+import logging
+import sqlite3
+import sys
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, asdict, field
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from functools import lru_cache
+from itertools import chain, islice, repeat
+from typing import ContextManager, Dict, Iterable, Iterator, List, Optional, Any, Tuple
 
+import numpy as np
 import pandas as pd
 
+# msgspec 可选导入（用于高速 JSON 序列化，未安装时回退到标准库 json）
+try:
+    import msgspec
+    HAS_MSGSPEC = True
+except ImportError:
+    msgspec = None
+    HAS_MSGSPEC = False
 
-@dataclass
+# pyarrow 可选导入（用于返回 Arrow 表）
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    pa = None
+    HAS_PYARROW = False
+
+logger = logging.getLogger(__name__)
+
+# DataFrame 中可直接映射到 StockDaily 的行情字段
+DATAFRAME_FIELDS = (
+    "open", "high", "low", "close", "volume", "amount", "pct_chg",
+    "ma5", "ma10", "ma20", "volume_ratio",
+)
+
+# 行情字段统一为 float64（整列为 NULL 时也不退化为 object）
+_DATAFRAME_DTYPES = {col: "float64" for col in DATAFRAME_FIELDS}
+
+# 写入数据库的字段（排除 id / created_at / updated_at 等自动生成字段）
+PERSIST_FIELDS = ("code", "date") + DATAFRAME_FIELDS + ("data_source",)
+
+# StockDaily 全部字段（与 dataclass 定义顺序一致）
+ALL_FIELDS = PERSIST_FIELDS + ("id", "created_at", "updated_at")
+_VALID_FIELDS = frozenset(ALL_FIELDS)
+
+# SQLite 单条语句最多绑定的参数个数（SQLITE_MAX_VARIABLE_NUMBER，3.32 之前默认 999）
+SQLITE_MAX_VARIABLES = 999
+
+# 多行 VALUES UPSERT 每条语句携带的行数（SQLite 3.32 起参数上限默认提高到 32766）
+MULTI_ROW_INSERT_ROWS = min(
+    100,
+    (32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else SQLITE_MAX_VARIABLES)
+    // len(PERSIST_FIELDS),
+)
+
+# 批量写入使用的暂存表
+_STAGE_TABLE = "stage_stock_daily"
+
+# === SQLite 后端共用的 SQL 语句 ===
+
+# UPSERT 冲突更新子句（各 SQLite 写入路径共用）
+UPSERT_CONFLICT_SQL = (
+    "ON CONFLICT(code, date) DO UPDATE SET "
+    + ", ".join(f"{col} = excluded.{col}" for col in PERSIST_FIELDS[2:])
+    + ", updated_at = CURRENT_TIMESTAMP"
+)
+
+# 单行 UPSERT（位置参数，顺序与 PERSIST_FIELDS / StockDaily.to_params() 一致）
+UPSERT_DAILY_SQL = (
+    f"INSERT INTO stock_daily ({', '.join(PERSIST_FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(PERSIST_FIELDS))}) "
+    + UPSERT_CONFLICT_SQL
+)
+
+# 按日期范围查询（列顺序与 StockDaily 字段一致，元组行可直接按位置构造）
+SELECT_DAILY_SQL = (
+    f"SELECT {', '.join(ALL_FIELDS)} FROM stock_daily "
+    "WHERE code = ? AND date BETWEEN ? AND ? ORDER BY date ASC"
+)
+
+LATEST_DATE_SQL = "SELECT MAX(date) as latest_date FROM stock_daily WHERE code = ?"
+STOCK_CODES_SQL = "SELECT DISTINCT code FROM stock_daily ORDER BY code"
+COUNT_BY_CODE_SQL = "SELECT COUNT(*) as cnt FROM stock_daily WHERE code = ?"
+COUNT_ALL_SQL = "SELECT COUNT(*) as cnt FROM stock_daily"
+DELETE_BY_CODE_SQL = "DELETE FROM stock_daily WHERE code = ?"
+DELETE_BEFORE_DATE_SQL = "DELETE FROM stock_daily WHERE date < ?"
+
+# 连接级预编译语句缓存容量（sqlite3 默认 128）
+CACHED_STATEMENTS = 256
+
+# get_daily_as_arrow 的固定表结构（列顺序同 ALL_FIELDS），避免整列为 NULL 时推断为 null 类型
+_ARROW_SCHEMA = pa.schema(
+    [("code", pa.string()), ("date", pa.date32())]
+    + [(col, pa.float64()) for col in DATAFRAME_FIELDS]
+    + [
+        ("data_source", pa.string()),
+        ("id", pa.int64()),
+        ("created_at", pa.string()),
+        ("updated_at", pa.string()),
+    ]
+) if HAS_PYARROW else None
+
+# 指定日期是否有数据
+_EXISTS_ON_DATE_SQL = "SELECT 1 FROM stock_daily WHERE code = ? AND date = ? LIMIT 1"
+
+# stock_daily 上的显式二级索引（不含 UNIQUE 约束自动生成的索引）
+_SECONDARY_INDEXES_SQL = (
+    "SELECT name, sql FROM sqlite_master "
+    "WHERE type = 'index' AND tbl_name = 'stock_daily' AND sql IS NOT NULL"
+)
+
+# 所有股票的最新日期（一次扫描 ix_code_date 完成）
+_LATEST_DATES_SQL = "SELECT code, MAX(date) FROM stock_daily GROUP BY code"
+
+
+@lru_cache(maxsize=8)
+def _multi_row_upsert_sql(n_rows: int) -> str:
+    """生成一次写入 n_rows 行的多行 VALUES UPSERT 语句"""
+    row = f"({', '.join('?' * len(PERSIST_FIELDS))})"
+    return (
+        f"INSERT INTO stock_daily ({', '.join(PERSIST_FIELDS)}) "
+        f"VALUES {', '.join([row] * n_rows)} "
+        + UPSERT_CONFLICT_SQL
+    )
+
+
+def _chunked(iterable: Iterable[Any], n: int) -> Iterator[List[Any]]:
+    """将可迭代对象按 n 个一组切分"""
+    it = iter(iterable)
+    while chunk := list(islice(it, n)):
+        yield chunk
+
+
+# 临时暂存表（无唯一索引，写入快）
+_CREATE_TEMP_STAGE_SQL = (
+    f"CREATE TEMP TABLE IF NOT EXISTS {_STAGE_TABLE} ("
+    "code TEXT, date TEXT, "
+    + ", ".join(f"{col} REAL" for col in DATAFRAME_FIELDS)
+    + ", data_source TEXT)"
+)
+_INSERT_TEMP_STAGE_SQL = (
+    f"INSERT INTO temp.{_STAGE_TABLE} ({', '.join(PERSIST_FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(PERSIST_FIELDS))})"
+)
+
+# 暂存表合并到 stock_daily（WHERE true 用于消除 SELECT ... ON CONFLICT 的语法歧义）
+_MERGE_STAGE_SQL = (
+    f"INSERT INTO stock_daily ({', '.join(PERSIST_FIELDS)}) "
+    f"SELECT {', '.join(PERSIST_FIELDS)} FROM temp.{_STAGE_TABLE} WHERE true "
+    + UPSERT_CONFLICT_SQL
+)
+
+
+@dataclass(slots=True)
 class StockDaily:
     """
     股票日线数据模型
@@ -41,57 +190,84 @@ class StockDaily:
     created_at: Optional[str] = None    # 创建时间
     updated_at: Optional[str] = None    # 更新时间
 
+    def __post_init__(self) -> None:
+        # 大量行共享同一股票代码/数据来源，驻留后只保留一份字符串
+        if isinstance(self.code, str):
+            self.code = sys.intern(self.code)
+        if isinstance(self.data_source, str):
+            self.data_source = sys.intern(self.data_source)
+
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典（排除自动生成字段，保留 None 值供 SQL 绑定）"""
-        result = {}
-        for key, value in asdict(self).items():
-            if key not in ('id', 'created_at', 'updated_at'):
-                result[key] = value
-        return result
+        return {f: getattr(self, f) for f in PERSIST_FIELDS}
+
+    def to_params(self) -> Tuple[Any, ...]:
+        """转换为元组（按 PERSIST_FIELDS 顺序，供位置参数 SQL 绑定）"""
+        return tuple(getattr(self, f) for f in PERSIST_FIELDS)
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "StockDaily":
-        """从字典创建"""
-        return cls(
-            code=data.get("code", ""),
-            date=data.get("date", ""),
-            open=data.get("open"),
-            high=data.get("high"),
-            low=data.get("low"),
-            close=data.get("close"),
-            volume=data.get("volume"),
-            amount=data.get("amount"),
-            pct_chg=data.get("pct_chg"),
-            ma5=data.get("ma5"),
-            ma10=data.get("ma10"),
-            ma20=data.get("ma20"),
-            volume_ratio=data.get("volume_ratio"),
-            data_source=data.get("data_source"),
-            id=data.get("id"),
-            created_at=data.get("created_at"),
-            updated_at=data.get("updated_at"),
-        )
+        """从字典创建（忽略非字段键，缺少 code/date 时为空字符串）"""
+        fields = {k: v for k, v in data.items() if k in _VALID_FIELDS}
+        fields.setdefault("code", "")
+        fields.setdefault("date", "")
+        return cls(**fields)
 
     @classmethod
     def from_dataframe_row(cls, row: pd.Series, code: str, data_source: str = "") -> "StockDaily":
-        """从 DataFrame 行创建"""
+        """从 DataFrame 行创建（委托给 convert_dataframe_to_stock_daily_list）"""
+        return convert_dataframe_to_stock_daily_list(row.to_frame().T, code, data_source)[0]
+
+
+@dataclass
+class StockDailyBatch:
+    """
+    股票日线批量数据（列式存储 SoA）
+
+    单只股票的多日数据按列保存为 numpy 数组，批量写入时直接按列拼装
+    SQL 参数行，无需逐条构造 StockDaily 实例
+    """
+
+    code: str                           # 股票代码
+    data_source: str                    # 数据来源
+    dates: np.ndarray                   # 日期列 (YYYY-MM-DD 字符串)
+    columns: Dict[str, np.ndarray]      # 行情列，键为 DATAFRAME_FIELDS，值为 float64 数组（NaN 表示缺失）
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, code: str, data_source: str = "") -> "StockDailyBatch":
+        """从 DataFrame 创建（已是 float64 的列不复制）"""
+        n = len(df)
+        columns = {}
+        for col in DATAFRAME_FIELDS:
+            if col in df.columns:
+                columns[col] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                columns[col] = np.full(n, np.nan)
+
         return cls(
             code=code,
-            date=str(row.get("date", row.name))[:10],
-            open=row.get("open"),
-            high=row.get("high"),
-            low=row.get("low"),
-            close=row.get("close"),
-            volume=row.get("volume"),
-            amount=row.get("amount"),
-            pct_chg=row.get("pct_chg"),
-            ma5=row.get("ma5"),
-            ma10=row.get("ma10"),
-            ma20=row.get("ma20"),
-            volume_ratio=row.get("volume_ratio"),
             data_source=data_source,
+            dates=_dataframe_dates(df).astype(object),
+            columns=columns,
+        )
+
+    def iter_rows(self) -> Iterator[Tuple[Any, ...]]:
+        """按 PERSIST_FIELDS 顺序逐行生成参数元组（可直接用于 executemany）"""
+        n = len(self)
+        return zip(
+            repeat(self.code, n),
+            self.dates.tolist(),
+            *(self.columns[col].tolist() for col in DATAFRAME_FIELDS),
+            repeat(self.data_source, n),
         )
 
+    def to_stock_daily_list(self) -> List[StockDaily]:
+        """转换为 StockDaily 列表"""
+        return [StockDaily(*row) for row in self.iter_rows()]
+
 
 class StockStorageBackend(ABC):
     """
@@ -147,6 +323,69 @@ class StockStorageBackend(ABC):
         """
         pass
 
+    def save_daily_batch_soa(self, batch: StockDailyBatch) -> int:
+        """
+        批量保存列式日线数据
+
+        默认实现转换为 StockDaily 列表后调用 save_daily_batch，
+        支持 executemany 的后端可覆盖此方法直接写入列数据
+
+        Args:
+            batch: 列式日线数据
+
+        Returns:
+            成功保存的记录数
+        """
+        if len(batch) == 0:
+            return 0
+        return self.save_daily_batch(batch.to_stock_daily_list())
+
+    def save_daily_batch_chunked(self, data_list: List[StockDaily], chunk_size: int = 500) -> int:
+        """
+        分块批量保存日线数据（兼容旧接口，等同于 save_daily_batch）
+
+        Args:
+            data_list: 股票日线数据列表
+            chunk_size: 已不再使用，save_daily_batch 自行分块
+
+        Returns:
+            成功保存的记录数
+        """
+        return self.save_daily_batch(data_list)
+
+    def save_daily_batch_staged(self, data_list: List[StockDaily]) -> int:
+        """
+        大批量保存日线数据
+
+        默认实现等同于 save_daily_batch，SQLite 后端通过暂存表合并写入
+
+        Args:
+            data_list: 股票日线数据列表
+
+        Returns:
+            成功保存的记录数
+        """
+        return self.save_daily_batch(data_list)
+
+    def save_from_dataframe_bulk(self, df: pd.DataFrame, code: str, data_source: str = "") -> int:
+        """
+        从 DataFrame 批量导入日线数据（兼容旧接口，等同于 save_from_dataframe）
+
+        Args:
+            df: 包含日线数据的 DataFrame
+            code: 股票代码
+            data_source: 数据来源
+
+        Returns:
+            成功保存的记录数
+        """
+        return self.save_from_dataframe(df, code, data_source)
+
+    @contextmanager
+    def bulk_load(self) -> Iterator["StockStorageBackend"]:
+        """首次大批量导入用的上下文管理器（默认不做额外处理）"""
+        yield self
+
     # === 数据查询方法 ===
 
     @abstractmethod
@@ -164,6 +403,20 @@ class StockStorageBackend(ABC):
         """
         pass
 
+    def iter_daily(self, code: str, start_date: str, end_date: str) -> Iterator[StockDaily]:
+        """
+        逐条迭代日线数据（默认实现遍历 get_daily 的结果）
+
+        Args:
+            code: 股票代码
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+
+        Yields:
+            StockDaily
+        """
+        return iter(self.get_daily(code, start_date, end_date))
+
     @abstractmethod
     def get_daily_as_dataframe(self, code: str, start_date: str, end_date: str) -> pd.DataFrame:
         """
@@ -179,6 +432,30 @@ class StockStorageBackend(ABC):
         """
         pass
 
+    def get_daily_as_arrow(self, code: str, start_date: str, end_date: str) -> "pa.Table":
+        """
+        查询日线数据并返回 pyarrow.Table
+
+        按固定的 _ARROW_SCHEMA 构建，不同股票的查询结果列类型一致，可直接 concat。
+        Arrow 表可零拷贝交给 pandas / polars / duckdb 使用
+
+        Args:
+            code: 股票代码
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+
+        Returns:
+            包含日线数据的 pyarrow.Table
+        """
+        if not HAS_PYARROW:
+            raise ImportError("pyarrow 未安装，请运行: pip install pyarrow")
+
+        rows = [
+            tuple(getattr(d, f) for f in ALL_FIELDS)
+            for d in self.get_daily(code, start_date, end_date)
+        ]
+        return _rows_to_arrow(rows)
+
     @abstractmethod
     def get_latest_date(self, code: str) -> Optional[str]:
         """
@@ -194,6 +471,35 @@ class StockStorageBackend(ABC):
         """
         pass
 
+    def get_latest_dates(self) -> Dict[str, str]:
+        """
+        获取所有股票的最新数据日期
+
+        默认实现逐只调用 get_latest_date
+
+        Returns:
+            {股票代码: 最新日期 (YYYY-MM-DD)}
+        """
+        latest_dates = {}
+        for code in self.get_stock_codes():
+            latest = self.get_latest_date(code)
+            if latest:
+                latest_dates[code] = latest
+        return latest_dates
+
+    def has_data_on(self, code: str, date_str: str) -> bool:
+        """
+        检查指定股票在指定日期是否有数据
+
+        Args:
+            code: 股票代码
+            date_str: 日期字符串 (YYYY-MM-DD)
+
+        Returns:
+            是否有数据
+        """
+        return bool(self.get_daily(code, date_str, date_str))
+
     @abstractmethod
     def get_stock_codes(self) -> List[str]:
         """
@@ -259,6 +565,373 @@ class StockStorageBackend(ABC):
         pass
 
 
+class SQLiteBackendMixin:
+    """
+    基于 SQLite 的存储后端共用实现
+
+    子类实现 _get_connection() 返回 SQLite 连接，并按
+    class XxxStorage(SQLiteBackendMixin, StockStorageBackend) 的顺序继承，
+    以下方法即覆盖基类的通用实现：暂存表批量写入、批量导入模式、
+    游标迭代 / 向量化读取 / 单次查询的最新日期与存在性检查
+    """
+
+    # save_daily_batch 超过该行数时改走暂存表合并（save_daily_batch_staged）
+    STAGED_BATCH_THRESHOLD = 10000
+
+    # 打开 SQLite 连接后执行的 PRAGMA（由 _apply_pragmas 应用，子类按需覆盖）
+    CONNECTION_PRAGMAS: Tuple[str, ...] = ()
+
+    # 批量写入期间持有的写锁（默认不加锁，多线程共享的后端在实例上设置为 RLock）
+    _write_lock: ContextManager[Any] = nullcontext()
+
+    # === 数据写入方法 ===
+
+    def save_daily_batch(self, data_list: List[StockDaily]) -> int:
+        """
+        批量保存日线数据（多行 VALUES UPSERT，整批一个事务）
+
+        超过 STAGED_BATCH_THRESHOLD 行时改走 save_daily_batch_staged
+
+        Args:
+            data_list: 股票日线数据列表
+
+        Returns:
+            成功保存的记录数
+        """
+        if not data_list:
+            return 0
+
+        if len(data_list) >= self.STAGED_BATCH_THRESHOLD:
+            return self.save_daily_batch_staged(data_list)
+
+        with self._write_lock:
+            return self._save_rows((d.to_params() for d in data_list))
+
+    def save_daily_batch_soa(self, batch: StockDailyBatch) -> int:
+        """
+        批量保存列式日线数据（按列直接拼装参数，不构造 StockDaily）
+
+        Args:
+            batch: 列式日线数据
+
+        Returns:
+            成功保存的记录数
+        """
+        if len(batch) == 0:
+            return 0
+
+        with self._write_lock:
+            return self._save_rows(batch.iter_rows())
+
+    def save_from_dataframe(self, df: pd.DataFrame, code: str, data_source: str = "") -> int:
+        """
+        从 DataFrame 保存日线数据
+
+        Args:
+            df: 包含日线数据的 DataFrame
+            code: 股票代码
+            data_source: 数据来源
+
+        Returns:
+            成功保存的记录数
+        """
+        if df.empty:
+            return 0
+
+        # 按列整体提取为数组，直接拼装参数行写入，不逐行构造 StockDaily
+        batch = StockDailyBatch.from_dataframe(df, code, data_source)
+        return self.save_daily_batch_soa(batch)
+
+    def _save_rows(self, rows: Iterable[Tuple[Any, ...]]) -> int:
+        """
+        在一个显式事务内 UPSERT 参数行，整批只提交一次，失败时整体回滚
+
+        Args:
+            rows: 参数行，顺序与 PERSIST_FIELDS 一致
+
+        Returns:
+            成功保存的记录数（失败时为 0）
+        """
+        conn = self._get_connection()
+        try:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            saved_count = self._upsert_multi_row(conn, rows)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"批量保存日线数据失败: {e}")
+            return 0
+        self._on_data_modified()
+        logger.info(f"批量保存日线数据: {saved_count} 条")
+        return saved_count
+
+    def save_daily_batch_staged(self, data_list: List[StockDaily]) -> int:
+        """
+        通过临时暂存表批量 UPSERT 日线数据
+
+        先 executemany 写入无唯一索引的 TEMP 表，再用一条
+        INSERT ... SELECT ... ON CONFLICT 合并到 stock_daily：冲突处理只规划一次，
+        整个过程在一个事务内完成。适合万行以上的大批量写入
+
+        Args:
+            data_list: 股票日线数据列表
+
+        Returns:
+            成功保存的记录数
+        """
+        if not data_list:
+            return 0
+
+        try:
+            with self._write_lock:
+                saved_count = self._merge_via_stage([d.to_params() for d in data_list])
+            logger.info(f"暂存表批量保存日线数据: {saved_count} 条")
+            return saved_count
+        except sqlite3.Error as e:
+            logger.error(f"暂存表批量保存日线数据失败: {e}")
+            return 0
+
+    def _merge_via_stage(self, rows: Iterable[Tuple[Any, ...]]) -> int:
+        """
+        在一个事务内写入 TEMP 暂存表并合并到 stock_daily
+
+        失败时回滚（TEMP 表的创建一并撤销）后重新抛出 sqlite3.Error
+
+        Args:
+            rows: 参数行，顺序与 PERSIST_FIELDS 一致
+
+        Returns:
+            合并的记录数
+        """
+        conn = self._get_connection()
+        try:
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            conn.execute(_CREATE_TEMP_STAGE_SQL)
+            conn.executemany(_INSERT_TEMP_STAGE_SQL, rows)
+            saved_count = conn.execute(_MERGE_STAGE_SQL).rowcount
+            conn.execute(f"DROP TABLE temp.{_STAGE_TABLE}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        self._on_data_modified()
+        return saved_count
+
+    @contextmanager
+    def bulk_load(self) -> Iterator["SQLiteBackendMixin"]:
+        """
+        首次大批量导入用的上下文管理器
+
+        进入时删除 stock_daily 的二级索引并关闭同步写盘，退出时重建索引、
+        恢复原同步级别。UNIQUE(code, date) 约束索引保留，UPSERT 不受影响。
+        期间持有写锁，其他线程的写入等待导入结束。
+
+        示例::
+
+            with storage.bulk_load():
+                for code, data_list in batches:
+                    storage.save_daily_batch(data_list)
+        """
+        with self._write_lock:
+            conn = self._get_connection()
+            conn.commit()
+            indexes = conn.execute(_SECONDARY_INDEXES_SQL).fetchall()
+            synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+
+            for name, _ in indexes:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.commit()
+            logger.info(f"进入批量导入模式，暂时删除索引: {[name for name, _ in indexes]}")
+            try:
+                yield self
+            finally:
+                conn.commit()
+                for _, sql in indexes:
+                    conn.execute(sql)
+                conn.execute(f"PRAGMA synchronous={synchronous}")
+                conn.commit()
+                logger.info("批量导入完成，索引已重建")
+
+    # === 数据查询方法 ===
+
+    def iter_daily(self, code: str, start_date: str, end_date: str) -> Iterator[StockDaily]:
+        """
+        逐条迭代日线数据（直接遍历游标，不一次性载入全部结果）
+
+        Args:
+            code: 股票代码
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+
+        Yields:
+            StockDaily
+        """
+        try:
+            cursor = self._get_connection().execute(SELECT_DAILY_SQL, (code, start_date, end_date))
+            for row in cursor:
+                yield StockDaily(*row)
+        except sqlite3.Error as e:
+            logger.error(f"查询日线数据失败: {e}")
+
+    def get_daily_as_dataframe(self, code: str, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        查询日线数据并返回 DataFrame
+
+        直接 pd.read_sql_query 向量化读取，不经过 StockDaily 列表中转
+
+        Args:
+            code: 股票代码
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+
+        Returns:
+            包含日线数据的 DataFrame
+        """
+        try:
+            return pd.read_sql_query(
+                SELECT_DAILY_SQL,
+                self._get_connection(),
+                params=(code, start_date, end_date),
+                parse_dates=["date"],
+                index_col="date",
+                dtype=_DATAFRAME_DTYPES,
+            )
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            logger.error(f"查询日线数据失败: {e}")
+            return pd.DataFrame()
+
+    def get_daily_as_arrow(self, code: str, start_date: str, end_date: str) -> "pa.Table":
+        """
+        查询日线数据并返回 pyarrow.Table
+
+        查询结果直接转置为列构建，不经过 StockDaily 或 DataFrame 中转
+
+        Args:
+            code: 股票代码
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+
+        Returns:
+            包含日线数据的 pyarrow.Table（查询失败时为空表）
+        """
+        if not HAS_PYARROW:
+            raise ImportError("pyarrow 未安装，请运行: pip install pyarrow")
+
+        try:
+            rows = self._get_connection().execute(
+                SELECT_DAILY_SQL, (code, start_date, end_date)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"查询日线数据失败: {e}")
+            return _ARROW_SCHEMA.empty_table()
+
+        return _rows_to_arrow(rows)
+
+    def get_latest_dates(self) -> Dict[str, str]:
+        """
+        一次查询获取所有股票的最新数据日期
+
+        逐只调用 get_latest_date 需要 N 次查询，批量场景应改用本方法后按代码查字典
+
+        Returns:
+            {股票代码: 最新日期 (YYYY-MM-DD)}
+        """
+        try:
+            conn = self._get_connection()
+            return {code: str(latest) for code, latest in conn.execute(_LATEST_DATES_SQL)}
+        except sqlite3.Error as e:
+            logger.error(f"获取最新日期失败: {e}")
+            return {}
+
+    def has_data_on(self, code: str, date_str: str) -> bool:
+        """
+        检查指定股票在指定日期是否有数据
+
+        执行一次 SELECT 1 ... LIMIT 1，只返回是否存在，不读取具体数据
+
+        Args:
+            code: 股票代码
+            date_str: 日期字符串 (YYYY-MM-DD)
+
+        Returns:
+            是否有数据
+        """
+        try:
+            row = self._get_connection().execute(_EXISTS_ON_DATE_SQL, (code, date_str)).fetchone()
+            return row is not None
+        except sqlite3.Error as e:
+            logger.error(f"检查数据是否存在失败: {e}")
+            return False
+
+    # === 资源管理方法 ===
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取 SQLite 连接（子类实现）"""
+        raise NotImplementedError
+
+    def _upsert_multi_row(self, conn: sqlite3.Connection, rows: Iterable[Tuple[Any, ...]]) -> int:
+        """
+        以多行 VALUES 语句批量 UPSERT（每条语句 MULTI_ROW_INSERT_ROWS 行）
+
+        相比逐行 executemany 减少语句调度次数；事务由调用方负责
+
+        Args:
+            conn: SQLite 连接
+            rows: 参数行，顺序与 PERSIST_FIELDS 一致
+
+        Returns:
+            写入的记录数
+        """
+        saved_count = 0
+        for chunk in _chunked(rows, MULTI_ROW_INSERT_ROWS):
+            sql = _multi_row_upsert_sql(len(chunk))
+            saved_count += conn.execute(sql, tuple(chain.from_iterable(chunk))).rowcount
+        return saved_count
+
+    def _apply_pragmas(self, conn: sqlite3.Connection) -> None:
+        """对新打开的 SQLite 连接应用 CONNECTION_PRAGMAS"""
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+    def _on_data_modified(self) -> None:
+        """共用写入实现写入数据后的回调（如远程后端标记待同步）"""
+        pass
+
+
+def _rows_to_arrow(rows: List[Tuple[Any, ...]]) -> "pa.Table":
+    """将按 ALL_FIELDS 排列的行一次性转置为列，按 _ARROW_SCHEMA 构建 pyarrow.Table"""
+    columns = list(zip(*rows)) or [()] * len(ALL_FIELDS)
+    data = {name: list(col) for name, col in zip(ALL_FIELDS, columns)}
+    # 日期以 ISO 字符串存储，转为 datetime64[D] 后写入 date32 列
+    data["date"] = np.array(data["date"], dtype="datetime64[D]")
+    return pa.Table.from_pydict(data, schema=_ARROW_SCHEMA)
+
+
+def _dataframe_dates(df: pd.DataFrame) -> np.ndarray:
+    """
+    一次性向量化提取日期列（无 date 列时使用索引），格式为 YYYY-MM-DD
+
+    datetime 类型的列/索引走 numpy datetime64[D] 转换（C 层一次完成）；
+    其余类型（字符串、整数等）保持原值的字符串前 10 位，不做日期推断
+    """
+    date_values = df["date"] if "date" in df.columns else df.index
+
+    if not pd.api.types.is_datetime64_any_dtype(date_values.dtype):
+        return date_values.astype(str).str.slice(0, 10).to_numpy()
+
+    # 带时区的时间（如 yfinance）保留本地日期，避免转换为 UTC 后跨日
+    if isinstance(date_values.dtype, pd.DatetimeTZDtype):
+        if isinstance(date_values, pd.Index):
+            date_values = date_values.tz_localize(None)
+        else:
+            date_values = date_values.dt.tz_localize(None)
+
+    return np.asarray(date_values, dtype="datetime64[D]").astype(str)
+
+
 def convert_dataframe_to_stock_daily_list(
     df: pd.DataFrame,
     code: str,
@@ -278,12 +951,16 @@ def convert_dataframe_to_stock_daily_list(
     if df.empty:
         return []
 
-    data_list = []
-    for _, row in df.iterrows():
-        stock_daily = StockDaily.from_dataframe_row(row, code, data_source)
-        data_list.append(stock_daily)
+    dates = _dataframe_dates(df).tolist()
+
+    # 按列整体转换，避免 iterrows 逐行构造 Series；缺失列沿用 StockDaily 默认值 None
+    columns = [col for col in DATAFRAME_FIELDS if col in df.columns]
+    records = df[columns].to_dict(orient="records")
 
-    return data_list
+    return [
+        StockDaily(code=code, date=date_str, data_source=data_source, **record)
+        for date_str, record in zip(dates, records)
+    ]
 
 
 def convert_stock_daily_list_to_dataframe(data_list: List[StockDaily]) -> pd.DataFrame:
@@ -299,8 +976,56 @@ def convert_stock_daily_list_to_dataframe(data_list: List[StockDaily]) -> pd.Dat
     if not data_list:
         return pd.DataFrame()
 
-    records = [asdict(d) for d in data_list]
-    df = pd.DataFrame(records)
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
-    return df
+    # 按列构建（SoA）并直接指定 dtype，跳过 pandas 对记录列表的类型推断
+    # code / data_source 重复度高，用 Categorical 按类别编码存储
+    n = len(data_list)
+    columns: Dict[str, Any] = {
+        "code": pd.Categorical([d.code for d in data_list]),
+    }
+    for f in DATAFRAME_FIELDS:
+        columns[f] = np.fromiter(
+            (np.nan if (v := getattr(d, f)) is None else v for d in data_list),
+            dtype=np.float64,
+            count=n,
+        )
+    columns["data_source"] = pd.Categorical([d.data_source for d in data_list])
+    for f in ("id", "created_at", "updated_at"):
+        columns[f] = np.array([getattr(d, f) for d in data_list], dtype=object)
+
+    dates = np.array([d.date for d in data_list], dtype="datetime64[D]").astype("datetime64[ns]")
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(dates, name="date"), copy=False)
+
+
+def encode_stock_daily_list(data_list: List[StockDaily]) -> bytes:
+    """
+    将 StockDaily 列表序列化为 JSON（用于缓存/网络传输）
+
+    安装 msgspec 时直接编码 dataclass（C 实现），否则回退到标准库 json
+
+    Args:
+        data_list: StockDaily 列表
+
+    Returns:
+        UTF-8 编码的 JSON 字节串
+    """
+    if HAS_MSGSPEC:
+        return msgspec.json.encode(data_list)
+
+    records = [{f: getattr(d, f) for f in ALL_FIELDS} for d in data_list]
+    return json.dumps(records, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def decode_stock_daily_list(data: bytes) -> List[StockDaily]:
+    """
+    从 JSON 反序列化 StockDaily 列表（encode_stock_daily_list 的逆操作）
+
+    Args:
+        data: JSON 字节串
+
+    Returns:
+        StockDaily 列表
+    """
+    if HAS_MSGSPEC:
+        return msgspec.json.decode(data, type=List[StockDaily])
+
+    return [StockDaily.from_dict(record) for record in json.loads(data)]
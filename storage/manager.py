@@ -8,18 +8,71 @@ A股自选股智能分析系统 - 存储管理器
 """
 
 import os
+import time
 import logging
-from typing import Optional, List
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, Optional, List, Tuple
 
 import pandas as pd
 
-from storage.base import StockStorageBackend, StockDaily
+from storage.base import StockStorageBackend, StockDaily, StockDailyBatch
 
 logger = logging.getLogger(__name__)
 
 # 存储管理器单例
 _storage_manager: Optional["StockStorageManager"] = None
 
+# 远程存储配置项对应的环境变量（remote_config 中未提供时使用）
+_REMOTE_ENV_KEYS = {
+    "bucket_name": "S3_BUCKET_NAME",
+    "access_key_id": "S3_ACCESS_KEY_ID",
+    "secret_access_key": "S3_SECRET_ACCESS_KEY",
+    "endpoint_url": "S3_ENDPOINT_URL",
+    "region": "S3_REGION",
+}
+
+# 远程存储行为开关对应的环境变量（remote_config 中未提供时使用，值为 1/true/yes/on 时开启）
+_REMOTE_FLAG_ENV_KEYS = {
+    "keep_local_cache": "S3_KEEP_LOCAL_CACHE",
+    "incremental_sync": "S3_INCREMENTAL_SYNC",
+    "write_only_mode": "S3_WRITE_ONLY_MODE",
+    "background_sync": "S3_BACKGROUND_SYNC",
+}
+
+
+def _probe_github_actions() -> bool:
+    """探测是否在 GitHub Actions 环境中运行"""
+    return os.environ.get("GITHUB_ACTIONS") == "true"
+
+
+def _probe_docker() -> bool:
+    """探测是否在 Docker 容器中运行（读取 /proc/1/cgroup）"""
+    if os.path.exists("/.dockerenv"):
+        return True
+
+    try:
+        with open("/proc/1/cgroup", "r") as f:
+            return "docker" in f.read()
+    except (FileNotFoundError, PermissionError):
+        pass
+
+    return os.environ.get("DOCKER_CONTAINER") == "true"
+
+
+# 运行环境在进程内不会变化，模块导入时探测一次
+_IS_GITHUB_ACTIONS = _probe_github_actions()
+_IS_DOCKER = _probe_docker()
+
+
+def is_github_actions() -> bool:
+    """检测是否在 GitHub Actions 环境中运行"""
+    return _IS_GITHUB_ACTIONS
+
+
+def is_docker() -> bool:
+    """检测是否在 Docker 容器中运行"""
+    return _IS_DOCKER
+
 
 class StockStorageManager:
     """
@@ -31,12 +84,31 @@ class StockStorageManager:
     - 提供统一的存储接口
     """
 
+    # 直接转发给后端的方法：后端就绪后绑定到实例，调用时跳过包装层
+    # （写入/删除方法需维护查询缓存，get_latest_date / get_stock_codes 带缓存，均不绑定）
+    _DELEGATED_METHODS = (
+        "get_daily",
+        "iter_daily",
+        "get_daily_as_dataframe",
+        "get_daily_as_arrow",
+        "has_data_on",
+        "get_record_count",
+    )
+
+    # maybe_prune() 两次清理之间的最小间隔（秒）
+    PRUNE_INTERVAL_SECONDS = 3600.0
+
+    is_github_actions = staticmethod(is_github_actions)
+    is_docker = staticmethod(is_docker)
+
     def __init__(
         self,
         backend_type: str = "local",
         db_path: Optional[str] = None,
         remote_config: Optional[dict] = None,
         retention_days: int = 0,
+        pool_size: int = 25,
+        cache_ttl_s: float = 5.0,
     ):
         """
         初始化存储管理器
@@ -51,53 +123,98 @@ class StockStorageManager:
                 - endpoint_url: 服务端点 URL
                 - region: 区域（可选）
                 - remote_db_key: 远程数据库对象键（可选，默认 stock/stock.db）
-            retention_days: 数据保留天数（0 = 无限制）
+                - keep_local_cache / incremental_sync / write_only_mode / background_sync:
+                  远程后端行为开关（可选，见 RemoteStockStorage，也可用 S3_* 环境变量设置）
+            retention_days: 数据保留天数（0 = 无限制，不清理），由 maybe_prune() 使用
+            pool_size: 远程存储连接池大小（25-50 为宜，避免无限增长）
+            cache_ttl_s: get_latest_date / get_stock_codes 结果缓存秒数（0 = 不缓存）
         """
         self.backend_type = backend_type
         self.db_path = db_path
         self.remote_config = remote_config or {}
         self.retention_days = retention_days
+        self.pool_size = pool_size
+        self.cache_ttl_s = cache_ttl_s
 
         self._backend: Optional[StockStorageBackend] = None
 
-    @staticmethod
-    def is_github_actions() -> bool:
-        """检测是否在 GitHub Actions 环境中运行"""
-        return os.environ.get("GITHUB_ACTIONS") == "true"
-
-    @staticmethod
-    def is_docker() -> bool:
-        """检测是否在 Docker 容器中运行"""
-        if os.path.exists("/.dockerenv"):
-            return True
-
-        try:
-            with open("/proc/1/cgroup", "r") as f:
-                return "docker" in f.read()
-        except (FileNotFoundError, PermissionError):
-            pass
+        # 上次清理过期数据的时间（time.monotonic），None 表示尚未清理
+        self._last_prune_ts: Optional[float] = None
+
+        # 查询结果缓存：{code: (写入时间, 最新日期)} 与 (写入时间, 股票代码列表)
+        self._latest_date_cache: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._codes_cache: Optional[Tuple[float, List[str]]] = None
+
+        # 配置与环境只在初始化时解析一次
+        self._merged_remote = self._merge_remote_config()
+        self._has_remote_config_result = self._has_remote_config()
+        self._resolved_type = self._resolve_backend_type()
+
+    def _bind_backend_methods(self) -> None:
+        """将后端方法绑定到实例属性，后续调用不再经过 get_backend()"""
+        for name in self._DELEGATED_METHODS:
+            setattr(self, name, getattr(self._backend, name))
+
+    def _unbind_backend_methods(self) -> None:
+        """移除绑定的后端方法，恢复为类上的转发方法"""
+        for name in self._DELEGATED_METHODS:
+            self.__dict__.pop(name, None)
+
+    def _merge_remote_config(self) -> dict:
+        """合并远程存储配置（remote_config 优先，其次为环境变量）"""
+        merged = {
+            key: self.remote_config.get(key) or os.environ.get(env_key, "")
+            for key, env_key in _REMOTE_ENV_KEYS.items()
+        }
+        merged["remote_db_key"] = self.remote_config.get("remote_db_key", "stock/stock.db")
+
+        # 行为开关只在显式配置时传入，未配置时沿用 RemoteStockStorage 的默认值
+        for key, env_key in _REMOTE_FLAG_ENV_KEYS.items():
+            value = self.remote_config.get(key)
+            if value is None:
+                env_value = os.environ.get(env_key, "").strip().lower()
+                if not env_value:
+                    continue
+                value = env_value in ("1", "true", "yes", "on")
+            merged[key] = bool(value)
+        return merged
+
+    def _invalidate_cache(self, codes: Optional[List[str]] = None) -> None:
+        """
+        使查询缓存失效
 
-        return os.environ.get("DOCKER_CONTAINER") == "true"
+        Args:
+            codes: 数据有变化的股票代码（None 表示全部）
+        """
+        self._codes_cache = None
+        if codes is None:
+            self._latest_date_cache.clear()
+        else:
+            for code in codes:
+                self._latest_date_cache.pop(code, None)
 
     def _resolve_backend_type(self) -> str:
         """解析实际使用的后端类型"""
         if self.backend_type == "auto":
-            if self.is_github_actions() and self._has_remote_config():
+            if self.is_github_actions() and self._has_remote_config_result:
                 return "remote"
             return "local"
         return self.backend_type
 
     def _has_remote_config(self) -> bool:
         """检查是否有有效的远程存储配置"""
-        bucket_name = self.remote_config.get("bucket_name") or os.environ.get("S3_BUCKET_NAME")
-        access_key = self.remote_config.get("access_key_id") or os.environ.get("S3_ACCESS_KEY_ID")
-        secret_key = self.remote_config.get("secret_access_key") or os.environ.get("S3_SECRET_ACCESS_KEY")
-        endpoint = self.remote_config.get("endpoint_url") or os.environ.get("S3_ENDPOINT_URL")
-
-        has_config = bool(bucket_name and access_key and secret_key and endpoint)
+        config = self._merged_remote
+        has_config = bool(
+            config["bucket_name"] and config["access_key_id"]
+            and config["secret_access_key"] and config["endpoint_url"]
+        )
 
-        if not has_config:
-            logger.debug(f"远程存储配置不完整: bucket={bool(bucket_name)}, key={bool(access_key)}, secret={bool(secret_key)}, endpoint={bool(endpoint)}")
+        if not has_config and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "远程存储配置不完整: bucket=%s, key=%s, secret=%s, endpoint=%s",
+                bool(config["bucket_name"]), bool(config["access_key_id"]),
+                bool(config["secret_access_key"]), bool(config["endpoint_url"]),
+            )
 
         return has_config
 
@@ -106,14 +223,7 @@ class StockStorageManager:
         try:
             from storage.remote import RemoteStockStorage
 
-            return RemoteStockStorage(
-                bucket_name=self.remote_config.get("bucket_name") or os.environ.get("S3_BUCKET_NAME", ""),
-                access_key_id=self.remote_config.get("access_key_id") or os.environ.get("S3_ACCESS_KEY_ID", ""),
-                secret_access_key=self.remote_config.get("secret_access_key") or os.environ.get("S3_SECRET_ACCESS_KEY", ""),
-                endpoint_url=self.remote_config.get("endpoint_url") or os.environ.get("S3_ENDPOINT_URL", ""),
-                region=self.remote_config.get("region") or os.environ.get("S3_REGION", ""),
-                remote_db_key=self.remote_config.get("remote_db_key", "stock/stock.db"),
-            )
+            return RemoteStockStorage(**self._merged_remote, pool_size=self.pool_size)
         except ImportError as e:
             logger.error(f"远程后端导入失败: {e}")
             logger.error("请确保已安装 boto3: pip install boto3")
@@ -125,7 +235,7 @@ class StockStorageManager:
     def get_backend(self) -> StockStorageBackend:
         """获取存储后端实例"""
         if self._backend is None:
-            resolved_type = self._resolve_backend_type()
+            resolved_type = self._resolved_type
 
             if resolved_type == "remote":
                 self._backend = self._create_remote_backend()
@@ -138,7 +248,9 @@ class StockStorageManager:
             if resolved_type == "local" or self._backend is None:
                 from storage.stock import StockStorage
                 self._backend = StockStorage(db_path=self.db_path)
-                logger.info(f"使用本地 SQLite 存储后端")
+                logger.info("使用本地 SQLite 存储后端")
+
+            self._bind_backend_methods()
 
         return self._backend
 
@@ -146,15 +258,47 @@ class StockStorageManager:
 
     def save_daily(self, data: StockDaily) -> bool:
         """保存单条日线数据"""
-        return self.get_backend().save_daily(data)
+        try:
+            return self.get_backend().save_daily(data)
+        finally:
+            # 写入完成后再失效，避免并发查询在写入前把旧结果重新放回缓存
+            self._invalidate_cache([data.code])
 
     def save_daily_batch(self, data_list: List[StockDaily]) -> int:
         """批量保存日线数据"""
-        return self.get_backend().save_daily_batch(data_list)
+        try:
+            return self.get_backend().save_daily_batch(data_list)
+        finally:
+            self._invalidate_cache({d.code for d in data_list})
+
+    def save_daily_batch_soa(self, batch: StockDailyBatch) -> int:
+        """批量保存列式日线数据"""
+        try:
+            return self.get_backend().save_daily_batch_soa(batch)
+        finally:
+            self._invalidate_cache([batch.code])
+
+    def save_daily_batch_chunked(self, data_list: List[StockDaily], chunk_size: int = 500) -> int:
+        """分块批量保存日线数据（兼容旧接口，等同于 save_daily_batch）"""
+        return self.save_daily_batch(data_list)
+
+    def save_daily_batch_staged(self, data_list: List[StockDaily]) -> int:
+        """通过临时暂存表批量保存日线数据（适合大批量）"""
+        try:
+            return self.get_backend().save_daily_batch_staged(data_list)
+        finally:
+            self._invalidate_cache({d.code for d in data_list})
 
     def save_from_dataframe(self, df: pd.DataFrame, code: str, data_source: str = "") -> int:
         """从 DataFrame 保存日线数据"""
-        return self.get_backend().save_from_dataframe(df, code, data_source)
+        try:
+            return self.get_backend().save_from_dataframe(df, code, data_source)
+        finally:
+            self._invalidate_cache([code])
+
+    def save_from_dataframe_bulk(self, df: pd.DataFrame, code: str, data_source: str = "") -> int:
+        """从 DataFrame 批量导入日线数据（兼容旧接口，等同于 save_from_dataframe）"""
+        return self.save_from_dataframe(df, code, data_source)
 
     # === 数据查询方法 ===
 
@@ -162,23 +306,56 @@ class StockStorageManager:
         """查询日线数据"""
         return self.get_backend().get_daily(code, start_date, end_date)
 
+    def iter_daily(self, code: str, start_date: str, end_date: str) -> Iterator[StockDaily]:
+        """逐条迭代日线数据"""
+        return self.get_backend().iter_daily(code, start_date, end_date)
+
     def get_daily_as_dataframe(self, code: str, start_date: str, end_date: str) -> pd.DataFrame:
         """查询日线数据并返回 DataFrame"""
         return self.get_backend().get_daily_as_dataframe(code, start_date, end_date)
 
+    def get_daily_as_arrow(self, code: str, start_date: str, end_date: str) -> Any:
+        """查询日线数据并返回 pyarrow.Table（需安装 pyarrow）"""
+        return self.get_backend().get_daily_as_arrow(code, start_date, end_date)
+
     def get_latest_date(self, code: str) -> Optional[str]:
-        """获取指定股票的最新数据日期"""
-        return self.get_backend().get_latest_date(code)
+        """获取指定股票的最新数据日期（cache_ttl_s 秒内复用上次结果）"""
+        now = time.monotonic()
+        cached = self._latest_date_cache.get(code)
+        if cached is not None and now - cached[0] < self.cache_ttl_s:
+            return cached[1]
+
+        latest = self.get_backend().get_latest_date(code)
+        self._latest_date_cache[code] = (now, latest)
+        return latest
+
+    def get_latest_dates(self) -> Dict[str, str]:
+        """获取所有股票的最新数据日期（一次查询，结果同时写入 get_latest_date 缓存）"""
+        now = time.monotonic()
+        latest_dates = self.get_backend().get_latest_dates()
+        for code, latest in latest_dates.items():
+            self._latest_date_cache[code] = (now, latest)
+        return latest_dates
+
+    def has_data_on(self, code: str, date_str: str) -> bool:
+        """检查指定股票在指定日期是否有数据"""
+        return self.get_backend().has_data_on(code, date_str)
 
     def get_stock_codes(self) -> List[str]:
-        """获取数据库中所有股票代码"""
-        return self.get_backend().get_stock_codes()
+        """获取数据库中所有股票代码（cache_ttl_s 秒内复用上次结果）"""
+        now = time.monotonic()
+        if self._codes_cache is not None and now - self._codes_cache[0] < self.cache_ttl_s:
+            return list(self._codes_cache[1])
+
+        codes = self.get_backend().get_stock_codes()
+        self._codes_cache = (now, codes)
+        return list(codes)
 
     def get_record_count(self, code: Optional[str] = None) -> int:
         """获取记录数量"""
         return self.get_backend().get_record_count(code)
 
-    def has_today_data(self, code: str, check_date: Optional["date"] = None) -> bool:
+    def has_today_data(self, code: str, check_date: Optional[date] = None) -> bool:
         """
         检查指定股票是否有今日数据
         
@@ -189,22 +366,55 @@ class StockStorageManager:
         Returns:
             是否有数据
         """
-        from datetime import date as date_type
-        target_date = check_date or date_type.today()
-        latest = self.get_latest_date(code)
-        if latest is None:
-            return False
-        return latest == target_date.strftime("%Y-%m-%d")
+        target_date = check_date or date.today()
+        return self.has_data_on(code, target_date.strftime("%Y-%m-%d"))
 
     # === 数据删除方法 ===
 
     def delete_by_code(self, code: str) -> int:
         """删除指定股票的所有数据"""
-        return self.get_backend().delete_by_code(code)
+        try:
+            return self.get_backend().delete_by_code(code)
+        finally:
+            self._invalidate_cache([code])
 
     def delete_before_date(self, date_str: str) -> int:
         """删除指定日期之前的所有数据"""
-        return self.get_backend().delete_before_date(date_str)
+        try:
+            return self.get_backend().delete_before_date(date_str)
+        finally:
+            self._invalidate_cache()
+
+    def maybe_prune(self, force: bool = False) -> int:
+        """
+        按 retention_days 清理过期数据（每小时最多执行一次）
+
+        清理通过单次 delete_before_date 完成，不在保存或关闭时自动触发，
+        需由调用方显式调用；retention_days 为 0 时不做任何清理。
+
+        Args:
+            force: 是否忽略间隔限制立即清理
+
+        Returns:
+            删除的记录数
+        """
+        if self.retention_days <= 0:
+            return 0
+
+        now = time.monotonic()
+        if (
+            not force
+            and self._last_prune_ts is not None
+            and now - self._last_prune_ts < self.PRUNE_INTERVAL_SECONDS
+        ):
+            return 0
+
+        self._last_prune_ts = now
+        cutoff = date.today() - timedelta(days=self.retention_days)
+        deleted = self.delete_before_date(cutoff.isoformat())
+        if deleted:
+            logger.info(f"清理 {cutoff} 之前的过期数据: {deleted} 条")
+        return deleted
 
     # === 资源管理方法 ===
 
@@ -223,8 +433,11 @@ class StockStorageManager:
     def close(self) -> None:
         """关闭存储后端"""
         if self._backend:
-            self._backend.close()
+            # 多线程连接的后端（本地 SQLite）关闭所有线程的连接
+            getattr(self._backend, "close_all", self._backend.close)()
             self._backend = None
+            self._unbind_backend_methods()
+            self._invalidate_cache()
 
     def __enter__(self) -> "StockStorageManager":
         return self
@@ -243,6 +456,8 @@ def get_stock_storage_manager(
     db_path: Optional[str] = None,
     remote_config: Optional[dict] = None,
     retention_days: int = 0,
+    pool_size: int = 25,
+    cache_ttl_s: float = 5.0,
     force_new: bool = False,
 ) -> StockStorageManager:
     """
@@ -253,6 +468,8 @@ def get_stock_storage_manager(
         db_path: 本地数据库路径
         remote_config: 远程存储配置
         retention_days: 数据保留天数（0 = 无限制）
+        pool_size: 远程存储连接池大小
+        cache_ttl_s: 查询结果缓存秒数（0 = 不缓存）
         force_new: 是否强制创建新实例
 
     Returns:
@@ -266,6 +483,8 @@ def get_stock_storage_manager(
             db_path=db_path,
             remote_config=remote_config,
             retention_days=retention_days,
+            pool_size=pool_size,
+            cache_ttl_s=cache_ttl_s,
         )
 
     return _storage_manager
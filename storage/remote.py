@@ -8,33 +8,111 @@ A股自选股智能分析系统 - 远程存储后端
 数据流程：下载远程 SQLite → 合并新数据 → 上传回远程
 """
 
+import gzip
+import io
+import json
 import logging
 import os
+import queue
+import shutil
 import sqlite3
 import tempfile
-from dataclasses import asdict
+import threading
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List
-
-import pandas as pd
+from typing import Any, Dict, Optional, List, Tuple
 
 # boto3 可选导入
 try:
     import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
     from botocore.exceptions import ClientError
     HAS_BOTO3 = True
 except ImportError:
     HAS_BOTO3 = False
     boto3 = None
+    TransferConfig = None
+    Config = None
     ClientError = Exception
 
-from storage.base import StockStorageBackend, StockDaily
+from storage.base import (
+    PERSIST_FIELDS,
+    CACHED_STATEMENTS,
+    UPSERT_DAILY_SQL,
+    SELECT_DAILY_SQL,
+    LATEST_DATE_SQL,
+    STOCK_CODES_SQL,
+    COUNT_BY_CODE_SQL,
+    COUNT_ALL_SQL,
+    DELETE_BY_CODE_SQL,
+    DELETE_BEFORE_DATE_SQL,
+    SQLiteBackendMixin,
+    StockStorageBackend,
+    StockDaily,
+)
 
 logger = logging.getLogger(__name__)
 
+# 增量同步：本会话写入/更新过的行记录在连接私有的 TEMP 表中（由 TEMP 触发器维护，
+# 不写入主库）。外层 UPSERT 的冲突策略会覆盖触发器内的 OR IGNORE，因此用 NOT EXISTS 去重
+_CREATE_CHANGED_ROWS_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS _changed_rows "
+    "(code, date, PRIMARY KEY (code, date)) WITHOUT ROWID"
+)
+_TRACK_CHANGES_TRIGGER_SQL = """
+CREATE TEMP TRIGGER IF NOT EXISTS _track_{event} AFTER {event} ON main.stock_daily
+BEGIN
+    INSERT INTO _changed_rows (code, date) SELECT new.code, new.date
+    WHERE NOT EXISTS (SELECT 1 FROM _changed_rows WHERE code = new.code AND date = new.date);
+END
+"""
+_SELECT_CHANGED_SQL = (
+    f"SELECT {', '.join('s.' + col for col in PERSIST_FIELDS)} "
+    "FROM temp._changed_rows c JOIN stock_daily s ON s.code = c.code AND s.date = c.date"
+)
+_CLEAR_CHANGED_SQL = "DELETE FROM temp._changed_rows"
+_GET_SYNC_META_SQL = "SELECT value FROM _sync_meta WHERE key = ?"
+_SET_SYNC_META_SQL = (
+    "INSERT INTO _sync_meta (key, value) VALUES (?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+)
+
+# S3 客户端缓存：相同端点/凭据/连接池配置的实例共用一个客户端
+_S3_CLIENT_CACHE: Dict[Tuple[Any, ...], Any] = {}
+_S3_CLIENT_LOCK = threading.Lock()
+
+
+def _get_s3_client(
+    endpoint_url: str,
+    access_key_id: str,
+    secret_access_key: str,
+    region: str,
+    pool_size: int,
+) -> Any:
+    """获取（必要时创建）共享的 S3 客户端，客户端本身线程安全"""
+    key = (endpoint_url, access_key_id, secret_access_key, region, pool_size)
+    with _S3_CLIENT_LOCK:
+        client = _S3_CLIENT_CACHE.get(key)
+        if client is None:
+            client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+                region_name=region or None,
+                config=Config(
+                    max_pool_connections=pool_size,
+                    tcp_keepalive=True,
+                    retries={"max_attempts": 3, "mode": "adaptive"},
+                ),
+            )
+            _S3_CLIENT_CACHE[key] = client
+        return client
 
-class RemoteStockStorage(StockStorageBackend):
+
+class RemoteStockStorage(SQLiteBackendMixin, StockStorageBackend):
     """
     远程云存储后端（S3 兼容协议）
 
@@ -72,6 +150,39 @@ class RemoteStockStorage(StockStorageBackend):
     CREATE INDEX IF NOT EXISTS ix_code_date ON stock_daily(code, date)
     """
 
+    CREATE_DATE_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS ix_date ON stock_daily(date)
+    """
+
+    # 增量同步元数据（epoch: 数据库纪元；changes_highwater: 已应用的最新变更集对象键）
+    CREATE_SYNC_META_SQL = """
+    CREATE TABLE IF NOT EXISTS _sync_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """
+
+    # 本地文件只是待整体上传的临时副本：不用 WAL（避免 -wal/-shm 附属文件），
+    # 日志放内存且不 fsync
+    CONNECTION_PRAGMAS = (
+        "PRAGMA journal_mode=MEMORY",
+        "PRAGMA synchronous=OFF",
+        "PRAGMA cache_size=-65536",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",
+    )
+
+    # 数据库文件传输参数：超过 8MB 分片并发传输，读写缓冲 1MB（默认 256KB）
+    TRANSFER_CHUNK_SIZE = 8 * 1024 * 1024
+    TRANSFER_MAX_CONCURRENCY = 10
+    TRANSFER_IO_CHUNK_SIZE = 1024 * 1024
+    # 小于该大小的数据库整块传输：下载用 download_fileobj 写入临时文件，
+    # 上传用 upload_fileobj + BytesIO 一次性读盘
+    INLINE_TRANSFER_THRESHOLD = 64 * 1024 * 1024
+
+    # 增量同步：远程变更集达到该数量时改为整库上传并清理已合并的变更集
+    MAX_CHANGESETS = 50
+
     def __init__(
         self,
         bucket_name: str,
@@ -81,6 +192,11 @@ class RemoteStockStorage(StockStorageBackend):
         region: str = "",
         remote_db_key: str = "stock/stock.db",
         temp_dir: Optional[str] = None,
+        pool_size: int = 25,
+        keep_local_cache: bool = True,
+        incremental_sync: bool = False,
+        write_only_mode: bool = False,
+        background_sync: bool = False,
     ):
         """
         初始化远程存储后端
@@ -93,6 +209,15 @@ class RemoteStockStorage(StockStorageBackend):
             region: 区域（某些服务需要）
             remote_db_key: 远程数据库文件的对象键
             temp_dir: 本地临时目录
+            pool_size: S3 客户端 HTTP 连接池大小（复用 TCP/TLS 连接）
+            keep_local_cache: 关闭时保留本地副本及其 ETag，下次远程未变化时跳过下载
+            incremental_sync: 增量同步模式，只上传本次会话变更的行（gzip JSON 变更集），
+                打开连接时按顺序合并远程上比本地新的变更集；删除操作仍触发整库上传。
+                多个写入方须错开运行（与整库上传模式相同，不做并发合并）
+            write_only_mode: 只写模式，不下载远程数据库，直接从空库开始写入，
+                同步时整库覆盖远程（不与远程已有数据合并），适合全量重建
+            background_sync: 后台上传模式，sync() 只复制一份快照交给后台线程上传后立即返回，
+                上传期间的多次 sync() 合并为一次；close() 等待上传完成（不适用于增量同步）
         """
         if not HAS_BOTO3:
             raise ImportError("boto3 未安装，请运行: pip install boto3")
@@ -101,19 +226,42 @@ class RemoteStockStorage(StockStorageBackend):
         self.remote_db_key = remote_db_key
         self.temp_dir = Path(temp_dir) if temp_dir else Path(tempfile.gettempdir()) / "stock_storage"
         self.temp_dir.mkdir(parents=True, exist_ok=True)
-
-        # 初始化 S3 客户端
-        self.s3_client = boto3.client(
-            "s3",
-            endpoint_url=endpoint_url,
-            aws_access_key_id=access_key_id,
-            aws_secret_access_key=secret_access_key,
-            region_name=region or None,
+        self.keep_local_cache = keep_local_cache
+        self.incremental_sync = incremental_sync
+        self.write_only_mode = write_only_mode
+        self.background_sync = background_sync and not incremental_sync
+
+        # S3 客户端（同配置的实例间共享）
+        self.s3_client = _get_s3_client(
+            endpoint_url, access_key_id, secret_access_key, region, pool_size
+        )
+        self._transfer_config = TransferConfig(
+            multipart_threshold=self.TRANSFER_CHUNK_SIZE,
+            multipart_chunksize=self.TRANSFER_CHUNK_SIZE,
+            max_concurrency=self.TRANSFER_MAX_CONCURRENCY,
+            io_chunksize=self.TRANSFER_IO_CHUNK_SIZE,
+            use_threads=True,
         )
 
         self._connection: Optional[sqlite3.Connection] = None
         self._local_db_path: Optional[Path] = None
+        # 本地数据库是否有尚未成功上传的修改，以及修改版本号（每次修改递增，
+        # 后台上传成功且期间无新修改时才清除 _db_modified）
         self._db_modified = False
+        self._modified_seq = 0
+        self._state_lock = threading.Lock()
+        # 本地副本对应的远程 ETag（None 表示远程不存在或未知）
+        self._remote_etag: Optional[str] = None
+        self._remote_size: Optional[int] = None
+        # 增量同步：本地数据库纪元，以及是否有删除等须整库上传的修改
+        self._sync_epoch: Optional[str] = None
+        self._needs_full_upload = False
+        # 后台上传：待上传快照队列（容量 1，新快照替换未开始的旧快照）、工作线程、
+        # 已排队快照对应的修改版本号，以及是否有后台上传失败
+        self._upload_queue: "queue.Queue[Optional[Tuple[int, Path]]]" = queue.Queue(maxsize=1)
+        self._upload_thread: Optional[threading.Thread] = None
+        self._enqueued_seq = 0
+        self._background_failed = False
 
         logger.info(f"远程存储后端初始化完成: {endpoint_url}/{bucket_name}")
 
@@ -125,108 +273,443 @@ class RemoteStockStorage(StockStorageBackend):
         """获取本地临时数据库路径"""
         return self.temp_dir / "stock.db"
 
-    def _check_object_exists(self, key: str) -> bool:
-        """检查远程对象是否存在"""
+    def _get_etag_path(self) -> Path:
+        """本地副本的 ETag 记录文件（记录本地副本对应的远程版本）"""
+        return self.temp_dir / "stock.db.etag"
+
+    def _read_cached_etag(self) -> Optional[str]:
+        """读取本地记录的 ETag"""
         try:
-            self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
-            return True
+            return self._get_etag_path().read_text(encoding="utf-8").strip() or None
+        except OSError:
+            return None
+
+    def _write_cached_etag(self, etag: Optional[str]) -> None:
+        """写入本地 ETag 记录（etag 为 None 时删除记录）"""
+        etag_path = self._get_etag_path()
+        try:
+            if etag:
+                etag_path.write_text(etag, encoding="utf-8")
+            else:
+                etag_path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"更新 ETag 记录失败: {e}")
+
+    def _get_remote_etag(self) -> Optional[str]:
+        """获取远程数据库的 ETag（远程不存在时返回 None）"""
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=self.remote_db_key)
         except ClientError as e:
             if e.response.get("Error", {}).get("Code") == "404":
-                return False
+                return None
             raise
+        self._remote_size = response.get("ContentLength")
+        return response.get("ETag", "")
 
-    def _download_database(self) -> bool:
+    def _download_database(self, discard_if_missing: bool = False) -> bool:
         """
         从远程下载数据库文件
 
+        Args:
+            discard_if_missing: 远程不存在时是否丢弃上次保留的本地副本（打开连接时从空库开始）
+
         Returns:
             是否下载成功（False 表示远程不存在，需要新建）
         """
-        if not self._check_object_exists(self.remote_db_key):
+        local_path = self._get_local_db_path()
+        remote_etag = self._get_remote_etag()
+        self._remote_etag = remote_etag
+
+        if remote_etag is None:
             logger.info("远程数据库不存在，将创建新数据库")
+            if discard_if_missing:
+                self._write_cached_etag(None)
+                local_path.unlink(missing_ok=True)
             return False
 
-        local_path = self._get_local_db_path()
+        # 本地副本与远程版本一致（ETag 相同）时跳过下载
+        if remote_etag and local_path.exists() and self._read_cached_etag() == remote_etag:
+            logger.info(f"远程数据库未变化，使用本地副本: {self.remote_db_key}")
+            return True
+
         try:
-            self.s3_client.download_file(
-                Bucket=self.bucket_name,
-                Key=self.remote_db_key,
-                Filename=str(local_path)
-            )
+            if self._remote_size is not None and self._remote_size < self.INLINE_TRANSFER_THRESHOLD:
+                # 先写临时文件再原子替换，中途失败不会留下被当作数据库打开的残缺文件
+                tmp_path = local_path.with_suffix(".tmp")
+                try:
+                    with open(tmp_path, "wb") as f:
+                        self.s3_client.download_fileobj(
+                            Bucket=self.bucket_name,
+                            Key=self.remote_db_key,
+                            Fileobj=f,
+                            Config=self._transfer_config,
+                        )
+                    os.replace(tmp_path, local_path)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+            else:
+                self.s3_client.download_file(
+                    Bucket=self.bucket_name,
+                    Key=self.remote_db_key,
+                    Filename=str(local_path),
+                    Config=self._transfer_config,
+                )
+            self._write_cached_etag(remote_etag)
             logger.info(f"下载远程数据库成功: {self.remote_db_key}")
             return True
-        except ClientError as e:
+        except (ClientError, OSError) as e:
+            self._remote_etag = None
             logger.error(f"下载远程数据库失败: {e}")
             return False
 
-    def _upload_database(self) -> bool:
+    def _upload_database(self, local_path: Optional[Path] = None) -> bool:
         """
         上传本地数据库到远程
 
+        单次 PUT 与分片上传的完成操作在 S3 端都是原子的，中途失败不会留下残缺对象
+
+        Args:
+            local_path: 要上传的文件（默认为本地数据库）
+
         Returns:
             是否上传成功
         """
-        local_path = self._get_local_db_path()
+        local_path = local_path or self._get_local_db_path()
         if not local_path.exists():
             logger.warning("本地数据库不存在，无法上传")
             return False
 
         try:
-            self.s3_client.upload_file(
-                Filename=str(local_path),
-                Bucket=self.bucket_name,
-                Key=self.remote_db_key
-            )
+            if local_path.stat().st_size < self.INLINE_TRANSFER_THRESHOLD:
+                self.s3_client.upload_fileobj(
+                    Fileobj=io.BytesIO(local_path.read_bytes()),
+                    Bucket=self.bucket_name,
+                    Key=self.remote_db_key,
+                    Config=self._transfer_config,
+                )
+            else:
+                self.s3_client.upload_file(
+                    Filename=str(local_path),
+                    Bucket=self.bucket_name,
+                    Key=self.remote_db_key,
+                    Config=self._transfer_config,
+                )
+            self._remote_etag = self._get_remote_etag()
             logger.info(f"上传数据库成功: {self.remote_db_key}")
             return True
-        except ClientError as e:
+        except (ClientError, OSError) as e:
             logger.error(f"上传数据库失败: {e}")
             return False
 
     def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接（自动下载远程数据库）"""
+        """获取数据库连接（自动下载远程数据库，只写模式下跳过下载）"""
         if self._connection is None:
-            # 尝试下载远程数据库
-            self._download_database()
-
             local_path = self._get_local_db_path()
+            if self.write_only_mode:
+                # 只写模式：跳过下载，从空库开始，同步时覆盖远程
+                self._remote_etag = None
+                local_path.unlink(missing_ok=True)
+            else:
+                # 尝试下载远程数据库（远程不存在时丢弃上次保留的本地副本，本会话未同步的修改除外）
+                self._download_database(discard_if_missing=not self._db_modified)
+
             self._local_db_path = local_path
 
+            # 连接打开期间本地副本可能被修改，ETag 记录在关闭且确认与远程一致后再写回
+            self._write_cached_etag(None)
+
             self._connection = sqlite3.connect(
                 str(local_path),
-                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+                cached_statements=CACHED_STATEMENTS,
             )
-            self._connection.row_factory = sqlite3.Row
+            self._apply_pragmas(self._connection)
 
             # 初始化表结构
             cursor = self._connection.cursor()
             cursor.execute(self.CREATE_TABLE_SQL)
             cursor.execute(self.CREATE_INDEX_SQL)
+            cursor.execute(self.CREATE_DATE_INDEX_SQL)
+            if self.incremental_sync:
+                cursor.execute(self.CREATE_SYNC_META_SQL)
             self._connection.commit()
 
+            if self.incremental_sync:
+                self._init_sync_epoch()
+                if not self.write_only_mode:
+                    self._apply_remote_changesets()
+                self._track_changes()
+
         return self._connection
 
+    def _on_data_modified(self) -> None:
+        """标记本地数据库已修改，关闭时同步到远程"""
+        with self._state_lock:
+            self._db_modified = True
+            self._modified_seq += 1
+
     def _sync_to_remote(self) -> bool:
-        """同步本地更改到远程"""
+        """
+        同步本地更改到远程
+
+        后台上传模式下只负责排队快照，修改标记在后台上传成功后才清除
+
+        Returns:
+            是否同步成功（后台模式为是否成功排队）
+        """
         if self._db_modified and self._connection:
             self._connection.commit()
-            result = self._upload_database()
+            if self.background_sync:
+                return self._enqueue_upload()
+            if self.incremental_sync:
+                result = self._upload_incremental()
+            else:
+                result = self._upload_database()
             if result:
                 self._db_modified = False
             return result
         return True
 
+    # === 后台上传 ===
+
+    def _enqueue_upload(self) -> bool:
+        """复制本地数据库快照并交给后台线程上传（替换尚未开始上传的旧快照）"""
+        seq = self._modified_seq
+        if seq == self._enqueued_seq:
+            # 当前版本已在队列中或正在上传
+            return True
+
+        snapshot = self.temp_dir / f"stock.db.upload-{seq}"
+        try:
+            shutil.copyfile(self._get_local_db_path(), snapshot)
+        except OSError as e:
+            logger.error(f"复制数据库快照失败: {e}")
+            return False
+
+        if self._upload_thread is None:
+            self._upload_thread = threading.Thread(
+                target=self._upload_worker, name="stock-db-upload", daemon=True
+            )
+            self._upload_thread.start()
+
+        try:
+            stale = self._upload_queue.get_nowait()
+            self._upload_queue.task_done()
+            if stale is not None:
+                stale[1].unlink(missing_ok=True)
+        except queue.Empty:
+            pass
+        self._enqueued_seq = seq
+        self._upload_queue.put((seq, snapshot))
+        return True
+
+    def _upload_worker(self) -> None:
+        """
+        后台上传线程：逐个上传快照，收到 None 时退出
+
+        上传成功且期间没有新修改时清除修改标记；失败时保留标记，下次 sync() 重新排队
+        """
+        while True:
+            item = self._upload_queue.get()
+            try:
+                if item is None:
+                    return
+                seq, snapshot = item
+                uploaded = self._upload_database(snapshot)
+                with self._state_lock:
+                    if uploaded:
+                        if seq == self._modified_seq:
+                            self._db_modified = False
+                    else:
+                        self._background_failed = True
+                        if seq == self._enqueued_seq:
+                            self._enqueued_seq = 0
+            finally:
+                if item is not None:
+                    item[1].unlink(missing_ok=True)
+                self._upload_queue.task_done()
+
+    def _wait_background_uploads(self) -> bool:
+        """
+        等待后台上传完成并停止工作线程，仍有未上传的修改时同步重试一次
+
+        Returns:
+            本地修改是否已全部上传到远程
+        """
+        if self._upload_thread is not None:
+            self._upload_queue.join()
+            self._upload_queue.put(None)
+            self._upload_thread.join()
+            self._upload_thread = None
+
+        failed, self._background_failed = self._background_failed, False
+        if self._db_modified:
+            if failed:
+                logger.warning("后台上传失败，改为同步上传重试")
+            if self._upload_database():
+                self._db_modified = False
+        return not self._db_modified
+
+    # === 增量同步 ===
+
+    def _changes_root(self) -> str:
+        """所有纪元变更集的公共对象键前缀"""
+        return f"{self.remote_db_key}.changes/"
+
+    def _changes_prefix(self) -> str:
+        """当前数据库纪元的变更集对象键前缀"""
+        return f"{self._changes_root()}{self._sync_epoch}/"
+
+    def _init_sync_epoch(self) -> None:
+        """
+        读取数据库纪元，没有时生成新纪元并要求下次同步整库上传
+
+        变更集按纪元分目录存放，读取方只合并与所下载数据库同纪元的变更集。
+        新建/重建（只写模式）的数据库获得新纪元，整库上传后旧纪元的变更集
+        即不会再被任何读取方重放
+        """
+        self._sync_epoch = self._get_sync_meta("epoch")
+        if self._sync_epoch is None:
+            self._sync_epoch = uuid.uuid4().hex
+            self._connection.execute(_SET_SYNC_META_SQL, ("epoch", self._sync_epoch))
+            self._connection.commit()
+            self._needs_full_upload = True
+
+    def _track_changes(self) -> None:
+        """安装 TEMP 触发器，记录本会话写入/更新的行（已合并的远程变更集不计入）"""
+        conn = self._connection
+        conn.execute(_CREATE_CHANGED_ROWS_SQL)
+        for event in ("INSERT", "UPDATE"):
+            conn.execute(_TRACK_CHANGES_TRIGGER_SQL.format(event=event))
+        conn.commit()
+
+    def _get_sync_meta(self, key: str) -> Optional[str]:
+        """读取增量同步元数据"""
+        row = self._connection.execute(_GET_SYNC_META_SQL, (key,)).fetchone()
+        return row[0] if row else None
+
+    def _list_changesets(self, prefix: Optional[str] = None) -> List[str]:
+        """
+        列出远程变更集对象键（按键名即生成时间排序）
+
+        Args:
+            prefix: 对象键前缀（默认为当前纪元）
+
+        Returns:
+            变更集对象键列表
+        """
+        keys: List[str] = []
+        kwargs = {"Bucket": self.bucket_name, "Prefix": prefix or self._changes_prefix()}
+        while True:
+            response = self.s3_client.list_objects_v2(**kwargs)
+            keys.extend(obj["Key"] for obj in response.get("Contents", []))
+            if not response.get("IsTruncated"):
+                return sorted(keys)
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    def _apply_remote_changesets(self) -> int:
+        """
+        合并远程上比本地新的变更集
+
+        Returns:
+            合并的记录数
+        """
+        conn = self._connection
+        highwater = self._get_sync_meta("changes_highwater") or ""
+        applied = 0
+        try:
+            keys = [key for key in self._list_changesets() if key > highwater]
+            for key in keys:
+                body = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+                rows = json.loads(gzip.decompress(body))
+                applied += self._upsert_multi_row(conn, map(tuple, rows))
+                conn.execute(_SET_SYNC_META_SQL, ("changes_highwater", key))
+            conn.commit()
+        except (ClientError, sqlite3.Error, OSError, ValueError) as e:
+            conn.rollback()
+            logger.error(f"合并远程变更集失败: {e}")
+            return 0
+
+        if keys:
+            logger.info(f"合并远程变更集: {len(keys)} 个, {applied} 条")
+        return applied
+
+    def _upload_incremental(self) -> bool:
+        """
+        增量同步：只上传本次会话变更的行
+
+        远程数据库不存在、数据库为新纪元、发生过删除或变更集过多时改为整库上传，
+        整库上传成功后清理已合并进数据库的变更集及其他纪元的全部变更集
+
+        Returns:
+            是否同步成功
+        """
+        conn = self._connection
+
+        try:
+            changesets = self._list_changesets()
+            if (
+                self._remote_etag is None
+                or self._needs_full_upload
+                or len(changesets) >= self.MAX_CHANGESETS
+            ):
+                if not self._upload_database():
+                    return False
+                conn.execute(_CLEAR_CHANGED_SQL)
+                conn.commit()
+                self._needs_full_upload = False
+                self._purge_changesets()
+                return True
+
+            rows = conn.execute(_SELECT_CHANGED_SQL).fetchall()
+            if not rows:
+                return True
+
+            key = f"{self._changes_prefix()}{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}.json.gz"
+            body = gzip.compress(
+                json.dumps(rows, default=str, separators=(",", ":")).encode("utf-8")
+            )
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=body)
+        except ClientError as e:
+            logger.error(f"增量同步失败: {e}")
+            return False
+
+        conn.execute(_CLEAR_CHANGED_SQL)
+        conn.execute(_SET_SYNC_META_SQL, ("changes_highwater", key))
+        conn.commit()
+        logger.info(f"上传增量变更: {len(rows)} 条 ({len(body)} 字节) → {key}")
+        return True
+
+    def _purge_changesets(self) -> None:
+        """整库上传后删除不再需要的变更集（失败只记录警告，下次整库上传时重试）"""
+        highwater = self._get_sync_meta("changes_highwater") or ""
+        own_prefix = self._changes_prefix()
+        try:
+            for key in self._list_changesets(self._changes_root()):
+                # 其他纪元的变更集不会再被读取；本纪元中不晚于 highwater 的已在数据库内
+                if not key.startswith(own_prefix) or key <= highwater:
+                    self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            logger.warning(f"清理远程变更集失败: {e}")
+
     def close(self) -> None:
         """关闭连接并同步到远程"""
         if self._connection:
             # 同步到远程
             self._sync_to_remote()
+            if self.background_sync:
+                self._wait_background_uploads()
 
             self._connection.close()
             self._connection = None
 
-            # 清理临时文件
-            if self._local_db_path and self._local_db_path.exists():
+            if self._db_modified:
+                # 修改未能同步到远程：保留本地副本，避免下次打开时被远程版本覆盖
+                self._preserve_unsynced_copy()
+            elif self.keep_local_cache:
+                # 本地副本与远程一致，保留副本并记录 ETag 供下次跳过下载
+                self._write_cached_etag(self._remote_etag)
+            elif self._local_db_path and self._local_db_path.exists():
+                # 清理临时文件
                 try:
                     self._local_db_path.unlink()
                 except OSError:
@@ -234,6 +717,20 @@ class RemoteStockStorage(StockStorageBackend):
 
             logger.debug("远程存储连接已关闭")
 
+    def _preserve_unsynced_copy(self) -> None:
+        """将未同步的本地数据库改名保存，并记录错误日志"""
+        if not (self._local_db_path and self._local_db_path.exists()):
+            logger.error("本地修改未能同步到远程，且本地数据库已不存在")
+            return
+        target = self._local_db_path.with_name(
+            f"{self._local_db_path.name}.unsynced-{datetime.now():%Y%m%d%H%M%S}"
+        )
+        try:
+            os.replace(self._local_db_path, target)
+            logger.error(f"本地修改未能同步到远程，已保留本地副本: {target}")
+        except OSError as e:
+            logger.error(f"本地修改未能同步到远程，保留本地副本失败: {e}")
+
     def __enter__(self) -> "RemoteStockStorage":
         return self
 
@@ -244,155 +741,43 @@ class RemoteStockStorage(StockStorageBackend):
 
     def save_daily(self, data: StockDaily) -> bool:
         """保存单条日线数据"""
-        sql = """
-        INSERT INTO stock_daily (code, date, open, high, low, close, volume, amount,
-                                  pct_chg, ma5, ma10, ma20, volume_ratio, data_source)
-        VALUES (:code, :date, :open, :high, :low, :close, :volume, :amount,
-                :pct_chg, :ma5, :ma10, :ma20, :volume_ratio, :data_source)
-        ON CONFLICT(code, date) DO UPDATE SET
-            open = excluded.open,
-            high = excluded.high,
-            low = excluded.low,
-            close = excluded.close,
-            volume = excluded.volume,
-            amount = excluded.amount,
-            pct_chg = excluded.pct_chg,
-            ma5 = excluded.ma5,
-            ma10 = excluded.ma10,
-            ma20 = excluded.ma20,
-            volume_ratio = excluded.volume_ratio,
-            data_source = excluded.data_source,
-            updated_at = CURRENT_TIMESTAMP
-        """
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, data.to_dict())
+            conn.execute(UPSERT_DAILY_SQL, data.to_params())
             conn.commit()
-            self._db_modified = True
+            self._on_data_modified()
             return True
         except sqlite3.Error as e:
             logger.error(f"保存日线数据失败: {e}")
             return False
 
-    def save_daily_batch(self, data_list: List[StockDaily]) -> int:
-        """批量保存日线数据"""
-        if not data_list:
-            return 0
-
-        sql = """
-        INSERT INTO stock_daily (code, date, open, high, low, close, volume, amount,
-                                  pct_chg, ma5, ma10, ma20, volume_ratio, data_source)
-        VALUES (:code, :date, :open, :high, :low, :close, :volume, :amount,
-                :pct_chg, :ma5, :ma10, :ma20, :volume_ratio, :data_source)
-        ON CONFLICT(code, date) DO UPDATE SET
-            open = excluded.open,
-            high = excluded.high,
-            low = excluded.low,
-            close = excluded.close,
-            volume = excluded.volume,
-            amount = excluded.amount,
-            pct_chg = excluded.pct_chg,
-            ma5 = excluded.ma5,
-            ma10 = excluded.ma10,
-            ma20 = excluded.ma20,
-            volume_ratio = excluded.volume_ratio,
-            data_source = excluded.data_source,
-            updated_at = CURRENT_TIMESTAMP
-        """
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.executemany(sql, [d.to_dict() for d in data_list])
-            conn.commit()
-            self._db_modified = True
-            saved_count = cursor.rowcount
-            logger.info(f"批量保存日线数据: {saved_count} 条")
-            return saved_count
-        except sqlite3.Error as e:
-            logger.error(f"批量保存日线数据失败: {e}")
-            return 0
-
-    def save_from_dataframe(self, df: pd.DataFrame, code: str, data_source: str = "") -> int:
-        """从 DataFrame 保存日线数据"""
-        if df.empty:
-            return 0
-
-        data_list = []
-        for _, row in df.iterrows():
-            stock_daily = StockDaily(
-                code=code,
-                date=str(row.get("date", row.name))[:10],
-                open=row.get("open"),
-                high=row.get("high"),
-                low=row.get("low"),
-                close=row.get("close"),
-                volume=row.get("volume"),
-                amount=row.get("amount"),
-                pct_chg=row.get("pct_chg"),
-                ma5=row.get("ma5"),
-                ma10=row.get("ma10"),
-                ma20=row.get("ma20"),
-                volume_ratio=row.get("volume_ratio"),
-                data_source=data_source,
-            )
-            data_list.append(stock_daily)
-
-        return self.save_daily_batch(data_list)
-
     # === 数据查询方法 ===
 
     def get_daily(self, code: str, start_date: str, end_date: str) -> List[StockDaily]:
         """查询日线数据"""
-        sql = """
-        SELECT * FROM stock_daily
-        WHERE code = ? AND date BETWEEN ? AND ?
-        ORDER BY date ASC
-        """
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (code, start_date, end_date))
-            rows = cursor.fetchall()
-            return [StockDaily.from_dict(dict(row)) for row in rows]
+            cursor = conn.execute(SELECT_DAILY_SQL, (code, start_date, end_date))
+            return [StockDaily(*row) for row in cursor]
         except sqlite3.Error as e:
             logger.error(f"查询日线数据失败: {e}")
             return []
 
-    def get_daily_as_dataframe(self, code: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """查询日线数据并返回 DataFrame"""
-        data_list = self.get_daily(code, start_date, end_date)
-        if not data_list:
-            return pd.DataFrame()
-
-        records = [asdict(d) for d in data_list]
-        df = pd.DataFrame(records)
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
-        return df
-
     def get_latest_date(self, code: str) -> Optional[str]:
         """获取指定股票的最新数据日期"""
-        sql = "SELECT MAX(date) as latest_date FROM stock_daily WHERE code = ?"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (code,))
-            row = cursor.fetchone()
-            return row["latest_date"] if row and row["latest_date"] else None
+            row = conn.execute(LATEST_DATE_SQL, (code,)).fetchone()
+            return row[0] if row and row[0] else None
         except sqlite3.Error as e:
             logger.error(f"获取最新日期失败: {e}")
             return None
 
     def get_stock_codes(self) -> List[str]:
         """获取数据库中所有股票代码"""
-        sql = "SELECT DISTINCT code FROM stock_daily ORDER BY code"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-            return [row["code"] for row in rows]
+            return [row[0] for row in conn.execute(STOCK_CODES_SQL)]
         except sqlite3.Error as e:
             logger.error(f"获取股票代码列表失败: {e}")
             return []
@@ -400,18 +785,16 @@ class RemoteStockStorage(StockStorageBackend):
     def get_record_count(self, code: Optional[str] = None) -> int:
         """获取记录数量"""
         if code:
-            sql = "SELECT COUNT(*) as cnt FROM stock_daily WHERE code = ?"
+            sql = COUNT_BY_CODE_SQL
             params = (code,)
         else:
-            sql = "SELECT COUNT(*) as cnt FROM stock_daily"
+            sql = COUNT_ALL_SQL
             params = ()
 
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, params)
-            row = cursor.fetchone()
-            return row["cnt"] if row else 0
+            row = conn.execute(sql, params).fetchone()
+            return row[0] if row else 0
         except sqlite3.Error as e:
             logger.error(f"获取记录数量失败: {e}")
             return 0
@@ -420,14 +803,14 @@ class RemoteStockStorage(StockStorageBackend):
 
     def delete_by_code(self, code: str) -> int:
         """删除指定股票的所有数据"""
-        sql = "DELETE FROM stock_daily WHERE code = ?"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (code,))
+            cursor = conn.execute(DELETE_BY_CODE_SQL, (code,))
             conn.commit()
-            self._db_modified = True
             deleted_count = cursor.rowcount
+            if deleted_count > 0:
+                self._on_data_modified()
+                self._needs_full_upload = True
             logger.info(f"删除股票 {code} 数据: {deleted_count} 条")
             return deleted_count
         except sqlite3.Error as e:
@@ -436,14 +819,14 @@ class RemoteStockStorage(StockStorageBackend):
 
     def delete_before_date(self, date_str: str) -> int:
         """删除指定日期之前的所有数据"""
-        sql = "DELETE FROM stock_daily WHERE date < ?"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (date_str,))
+            cursor = conn.execute(DELETE_BEFORE_DATE_SQL, (date_str,))
             conn.commit()
-            self._db_modified = True
             deleted_count = cursor.rowcount
+            if deleted_count > 0:
+                self._on_data_modified()
+                self._needs_full_upload = True
             logger.info(f"删除 {date_str} 之前的数据: {deleted_count} 条")
             return deleted_count
         except sqlite3.Error as e:
@@ -458,7 +841,7 @@ class RemoteStockStorage(StockStorageBackend):
 
     def pull(self) -> bool:
         """
-        从远程拉取最新数据（覆盖本地）
+        从远程拉取最新数据（覆盖本地；远程不存在时保留本地数据）
 
         Returns:
             是否拉取成功
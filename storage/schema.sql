@@ -33,3 +33,6 @@ CREATE TABLE IF NOT EXISTS stock_daily (
 
 -- 股票代码 + 日期联合索引（主查询索引）
 CREATE INDEX IF NOT EXISTS ix_code_date ON stock_daily(code, date);
+
+-- 日期索引（按保留天数清理旧数据时走索引范围扫描）
+CREATE INDEX IF NOT EXISTS ix_date ON stock_daily(date);
@@ -11,21 +11,73 @@ A股自选股智能分析系统 - 股票数据存储层
 4. 实现智能更新逻辑（断点续传）
 """
 
+import functools
 import logging
+import os
+import shutil
 import sqlite3
-from dataclasses import asdict
+import tempfile
+import threading
 from datetime import datetime
-from typing import Optional, List
+from multiprocessing import Pool
+from typing import Any, Callable, Dict, Optional, List, Tuple
 from pathlib import Path
 
-import pandas as pd
-
-from storage.base import StockStorageBackend, StockDaily
+from storage.base import (
+    PERSIST_FIELDS,
+    CACHED_STATEMENTS,
+    UPSERT_DAILY_SQL,
+    SELECT_DAILY_SQL,
+    LATEST_DATE_SQL,
+    STOCK_CODES_SQL,
+    COUNT_BY_CODE_SQL,
+    COUNT_ALL_SQL,
+    DELETE_BY_CODE_SQL,
+    DELETE_BEFORE_DATE_SQL,
+    UPSERT_CONFLICT_SQL,
+    SQLiteBackendMixin,
+    StockStorageBackend,
+    StockDaily,
+)
 
 logger = logging.getLogger(__name__)
 
+# SQLite 默认最多同时附加的数据库个数（SQLITE_MAX_ATTACHED）
+_MAX_ATTACHED = 10
+
+
+def _merge_shard_sql(schema: str) -> str:
+    """将附加分片库 schema 中的数据 UPSERT 到主库"""
+    return (
+        f"INSERT INTO main.stock_daily ({', '.join(PERSIST_FIELDS)}) "
+        f"SELECT {', '.join(PERSIST_FIELDS)} FROM {schema}.stock_daily WHERE true "
+        + UPSERT_CONFLICT_SQL
+    )
+
 
-class StockStorage(StockStorageBackend):
+def _serialized_write(method: Callable[..., Any]) -> Callable[..., Any]:
+    """写入方法装饰器：同一 StockStorage 的写入在进程内串行执行（SQLite 同时只允许一个写入者）"""
+    @functools.wraps(method)
+    def wrapper(self: "StockStorage", *args: Any, **kwargs: Any) -> Any:
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _ingest_shard(shard_path: str, data_lists: List[List[StockDaily]]) -> int:
+    """子进程任务：将分配到的数据写入独立的分片数据库"""
+    shard = StockStorage(shard_path)
+    try:
+        saved_count = 0
+        with shard.bulk_load():
+            for data_list in data_lists:
+                saved_count += shard.save_daily_batch(data_list)
+        return saved_count
+    finally:
+        shard.close()
+
+
+class StockStorage(SQLiteBackendMixin, StockStorageBackend):
     """
     股票数据 SQLite 存储实现
 
@@ -34,6 +86,10 @@ class StockStorage(StockStorageBackend):
     - 保存/查询日线数据
     - 批量操作支持
     - 断点续传（智能更新）
+
+    线程模型：每个线程使用各自的连接（WAL 模式下读互不阻塞），
+    写入方法通过进程内写锁串行执行。close() 只关闭调用线程的连接，
+    close_all() 关闭所有线程的连接
     """
 
     # 表结构 SQL（与 schema.sql 保持一致）
@@ -64,6 +120,19 @@ class StockStorage(StockStorageBackend):
     CREATE INDEX IF NOT EXISTS ix_code_date ON stock_daily(code, date)
     """
 
+    CREATE_DATE_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS ix_date ON stock_daily(date)
+    """
+
+    # 写入吞吐调优：WAL 日志 + NORMAL 同步，64MB 页缓存，临时表放内存，256MB mmap
+    CONNECTION_PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=-65536",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",
+    )
+
     def __init__(self, db_path: Optional[str] = None):
         """
         初始化存储管理器
@@ -77,18 +146,30 @@ class StockStorage(StockStorageBackend):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
 
-        self._connection: Optional[sqlite3.Connection] = None
+        # 线程本地连接：_tls.conn 为当前线程的连接，_tls.generation 对应 close_all 的代数
+        self._tls = threading.local()
+        self._generation = 0
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.RLock()
         self._init_database()
 
     def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接（单例模式）"""
-        if self._connection is None:
-            self._connection = sqlite3.connect(
+        """获取当前线程的数据库连接（首次使用时创建）"""
+        conn = getattr(self._tls, "conn", None)
+        if conn is None or self._tls.generation != self._generation:
+            # check_same_thread=False 仅为允许 close_all() 跨线程关闭，连接本身不跨线程使用
+            conn = sqlite3.connect(
                 str(self.db_path),
-                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+                cached_statements=CACHED_STATEMENTS,
+                check_same_thread=False,
             )
-            self._connection.row_factory = sqlite3.Row
-        return self._connection
+            self._apply_pragmas(conn)
+            with self._connections_lock:
+                self._connections.append(conn)
+            self._tls.conn = conn
+            self._tls.generation = self._generation
+        return conn
 
     def _init_database(self) -> None:
         """初始化数据库表结构"""
@@ -97,22 +178,37 @@ class StockStorage(StockStorageBackend):
 
         cursor.execute(self.CREATE_TABLE_SQL)
         cursor.execute(self.CREATE_INDEX_SQL)
+        cursor.execute(self.CREATE_DATE_INDEX_SQL)
 
         conn.commit()
         logger.info(f"数据库初始化完成: {self.db_path}")
 
     def close(self) -> None:
-        """关闭数据库连接"""
-        if self._connection is not None:
-            self._connection.close()
-            self._connection = None
+        """关闭当前线程的数据库连接"""
+        conn = getattr(self._tls, "conn", None)
+        if conn is not None:
+            self._tls.conn = None
+            with self._connections_lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
             logger.debug("数据库连接已关闭")
 
+    def close_all(self) -> None:
+        """关闭所有线程的数据库连接（其他线程下次使用时会重新建立连接）"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+        self._tls.conn = None
+        logger.debug(f"已关闭全部数据库连接: {len(connections)} 个")
+
     def __enter__(self) -> "StockStorage":
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
-        self.close()
+        self.close_all()
 
     @property
     def backend_name(self) -> str:
@@ -121,6 +217,7 @@ class StockStorage(StockStorageBackend):
 
     # === 数据写入方法 ===
 
+    @_serialized_write
     def save_daily(self, data: StockDaily) -> bool:
         """
         保存单条日线数据（UPSERT 模式）
@@ -131,118 +228,15 @@ class StockStorage(StockStorageBackend):
         Returns:
             是否保存成功
         """
-        sql = """
-        INSERT INTO stock_daily (code, date, open, high, low, close, volume, amount,
-                                  pct_chg, ma5, ma10, ma20, volume_ratio, data_source)
-        VALUES (:code, :date, :open, :high, :low, :close, :volume, :amount,
-                :pct_chg, :ma5, :ma10, :ma20, :volume_ratio, :data_source)
-        ON CONFLICT(code, date) DO UPDATE SET
-            open = excluded.open,
-            high = excluded.high,
-            low = excluded.low,
-            close = excluded.close,
-            volume = excluded.volume,
-            amount = excluded.amount,
-            pct_chg = excluded.pct_chg,
-            ma5 = excluded.ma5,
-            ma10 = excluded.ma10,
-            ma20 = excluded.ma20,
-            volume_ratio = excluded.volume_ratio,
-            data_source = excluded.data_source,
-            updated_at = CURRENT_TIMESTAMP
-        """
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, data.to_dict())
+            conn.execute(UPSERT_DAILY_SQL, data.to_params())
             conn.commit()
             return True
         except sqlite3.Error as e:
             logger.error(f"保存日线数据失败: {e}")
             return False
 
-    def save_daily_batch(self, data_list: List[StockDaily]) -> int:
-        """
-        批量保存日线数据
-
-        Args:
-            data_list: 股票日线数据列表
-
-        Returns:
-            成功保存的记录数
-        """
-        if not data_list:
-            return 0
-
-        sql = """
-        INSERT INTO stock_daily (code, date, open, high, low, close, volume, amount,
-                                  pct_chg, ma5, ma10, ma20, volume_ratio, data_source)
-        VALUES (:code, :date, :open, :high, :low, :close, :volume, :amount,
-                :pct_chg, :ma5, :ma10, :ma20, :volume_ratio, :data_source)
-        ON CONFLICT(code, date) DO UPDATE SET
-            open = excluded.open,
-            high = excluded.high,
-            low = excluded.low,
-            close = excluded.close,
-            volume = excluded.volume,
-            amount = excluded.amount,
-            pct_chg = excluded.pct_chg,
-            ma5 = excluded.ma5,
-            ma10 = excluded.ma10,
-            ma20 = excluded.ma20,
-            volume_ratio = excluded.volume_ratio,
-            data_source = excluded.data_source,
-            updated_at = CURRENT_TIMESTAMP
-        """
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.executemany(sql, [d.to_dict() for d in data_list])
-            conn.commit()
-            saved_count = cursor.rowcount
-            logger.info(f"批量保存日线数据: {saved_count} 条")
-            return saved_count
-        except sqlite3.Error as e:
-            logger.error(f"批量保存日线数据失败: {e}")
-            return 0
-
-    def save_from_dataframe(self, df: pd.DataFrame, code: str, data_source: str = "") -> int:
-        """
-        从 DataFrame 保存日线数据
-
-        Args:
-            df: 包含日线数据的 DataFrame
-            code: 股票代码
-            data_source: 数据来源
-
-        Returns:
-            成功保存的记录数
-        """
-        if df.empty:
-            return 0
-
-        data_list = []
-        for _, row in df.iterrows():
-            stock_daily = StockDaily(
-                code=code,
-                date=str(row.get("date", row.name))[:10],
-                open=row.get("open"),
-                high=row.get("high"),
-                low=row.get("low"),
-                close=row.get("close"),
-                volume=row.get("volume"),
-                amount=row.get("amount"),
-                pct_chg=row.get("pct_chg"),
-                ma5=row.get("ma5"),
-                ma10=row.get("ma10"),
-                ma20=row.get("ma20"),
-                volume_ratio=row.get("volume_ratio"),
-                data_source=data_source,
-            )
-            data_list.append(stock_daily)
-
-        return self.save_daily_batch(data_list)
-
     # === 数据查询方法 ===
 
     def get_daily(self, code: str, start_date: str, end_date: str) -> List[StockDaily]:
@@ -257,43 +251,14 @@ class StockStorage(StockStorageBackend):
         Returns:
             日线数据列表
         """
-        sql = """
-        SELECT * FROM stock_daily
-        WHERE code = ? AND date BETWEEN ? AND ?
-        ORDER BY date ASC
-        """
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (code, start_date, end_date))
-            rows = cursor.fetchall()
-            return [StockDaily.from_dict(dict(row)) for row in rows]
+            cursor = conn.execute(SELECT_DAILY_SQL, (code, start_date, end_date))
+            return [StockDaily(*row) for row in cursor]
         except sqlite3.Error as e:
             logger.error(f"查询日线数据失败: {e}")
             return []
 
-    def get_daily_as_dataframe(self, code: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """
-        查询日线数据并返回 DataFrame
-
-        Args:
-            code: 股票代码
-            start_date: 开始日期 (YYYY-MM-DD)
-            end_date: 结束日期 (YYYY-MM-DD)
-
-        Returns:
-            包含日线数据的 DataFrame
-        """
-        data_list = self.get_daily(code, start_date, end_date)
-        if not data_list:
-            return pd.DataFrame()
-
-        records = [asdict(d) for d in data_list]
-        df = pd.DataFrame(records)
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
-        return df
-
     def get_latest_date(self, code: str) -> Optional[str]:
         """
         获取指定股票的最新数据日期
@@ -306,13 +271,10 @@ class StockStorage(StockStorageBackend):
         Returns:
             最新日期字符串 (YYYY-MM-DD)，无数据时返回 None
         """
-        sql = "SELECT MAX(date) as latest_date FROM stock_daily WHERE code = ?"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (code,))
-            row = cursor.fetchone()
-            return row["latest_date"] if row and row["latest_date"] else None
+            row = conn.execute(LATEST_DATE_SQL, (code,)).fetchone()
+            return row[0] if row and row[0] else None
         except sqlite3.Error as e:
             logger.error(f"获取最新日期失败: {e}")
             return None
@@ -324,13 +286,9 @@ class StockStorage(StockStorageBackend):
         Returns:
             股票代码列表
         """
-        sql = "SELECT DISTINCT code FROM stock_daily ORDER BY code"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-            return [row["code"] for row in rows]
+            return [row[0] for row in conn.execute(STOCK_CODES_SQL)]
         except sqlite3.Error as e:
             logger.error(f"获取股票代码列表失败: {e}")
             return []
@@ -346,24 +304,23 @@ class StockStorage(StockStorageBackend):
             记录数量
         """
         if code:
-            sql = "SELECT COUNT(*) as cnt FROM stock_daily WHERE code = ?"
+            sql = COUNT_BY_CODE_SQL
             params = (code,)
         else:
-            sql = "SELECT COUNT(*) as cnt FROM stock_daily"
+            sql = COUNT_ALL_SQL
             params = ()
 
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, params)
-            row = cursor.fetchone()
-            return row["cnt"] if row else 0
+            row = conn.execute(sql, params).fetchone()
+            return row[0] if row else 0
         except sqlite3.Error as e:
             logger.error(f"获取记录数量失败: {e}")
             return 0
 
     # === 数据删除方法 ===
 
+    @_serialized_write
     def delete_by_code(self, code: str) -> int:
         """
         删除指定股票的所有数据
@@ -374,11 +331,9 @@ class StockStorage(StockStorageBackend):
         Returns:
             删除的记录数
         """
-        sql = "DELETE FROM stock_daily WHERE code = ?"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (code,))
+            cursor = conn.execute(DELETE_BY_CODE_SQL, (code,))
             conn.commit()
             deleted_count = cursor.rowcount
             logger.info(f"删除股票 {code} 数据: {deleted_count} 条")
@@ -387,6 +342,7 @@ class StockStorage(StockStorageBackend):
             logger.error(f"删除数据失败: {e}")
             return 0
 
+    @_serialized_write
     def delete_before_date(self, date_str: str) -> int:
         """
         删除指定日期之前的所有数据
@@ -397,11 +353,9 @@ class StockStorage(StockStorageBackend):
         Returns:
             删除的记录数
         """
-        sql = "DELETE FROM stock_daily WHERE date < ?"
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (date_str,))
+            cursor = conn.execute(DELETE_BEFORE_DATE_SQL, (date_str,))
             conn.commit()
             deleted_count = cursor.rowcount
             logger.info(f"删除 {date_str} 之前的数据: {deleted_count} 条")
@@ -410,6 +364,74 @@ class StockStorage(StockStorageBackend):
             logger.error(f"删除数据失败: {e}")
             return 0
 
+    # === 并行导入 ===
+
+    @_serialized_write
+    def ingest_parallel(
+        self,
+        code_to_records: Dict[str, List[StockDaily]],
+        n_workers: Optional[int] = None,
+    ) -> int:
+        """
+        多进程并行导入（首次全量导入大量股票时使用）
+
+        SQLite 同一文件只允许一个写入者：按股票代码把数据分给 n_workers 个子进程，
+        各自写入独立的分片库，全部完成后在主进程 ATTACH 分片库，
+        用 INSERT ... SELECT 在一个事务内合并到主库
+
+        Args:
+            code_to_records: {股票代码: 日线数据列表}
+            n_workers: 子进程数（默认 CPU 核数，最多 10 个，受 SQLite 附加库上限约束）
+
+        Returns:
+            合并到主库的记录数
+        """
+        items = [records for records in code_to_records.values() if records]
+        if not items:
+            return 0
+
+        n_workers = min(n_workers or os.cpu_count() or 1, _MAX_ATTACHED, len(items))
+        if n_workers <= 1:
+            return sum(self.save_daily_batch(records) for records in items)
+
+        shard_dir = Path(tempfile.mkdtemp(prefix="shards_", dir=self.db_path.parent))
+        tasks: List[Tuple[str, List[List[StockDaily]]]] = [
+            (str(shard_dir / f"shard_{i}.db"), items[i::n_workers]) for i in range(n_workers)
+        ]
+        conn = self._get_connection()
+        try:
+            with Pool(n_workers) as pool:
+                pool.starmap(_ingest_shard, tasks)
+
+            conn.commit()
+            schemas: List[str] = []
+            try:
+                for i, (shard_path, _) in enumerate(tasks):
+                    conn.execute("ATTACH DATABASE ? AS ?", (shard_path, f"shard_{i}"))
+                    schemas.append(f"shard_{i}")
+
+                conn.execute("BEGIN IMMEDIATE")
+                saved_count = sum(conn.execute(_merge_shard_sql(schema)).rowcount for schema in schemas)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            finally:
+                # 只分离实际附加成功的分片库
+                for schema in schemas:
+                    try:
+                        conn.execute(f"DETACH DATABASE {schema}")
+                    except sqlite3.Error as e:
+                        logger.warning(f"分离分片库失败: {schema}: {e}")
+
+            logger.info(f"并行导入日线数据: {saved_count} 条（{n_workers} 个分片）")
+            return saved_count
+        except sqlite3.Error as e:
+            logger.error(f"并行导入日线数据失败: {e}")
+            return 0
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
 
 # === 模块级便捷函数 ===
 
@@ -428,5 +450,5 @@ def close_stock_storage() -> None:
     """关闭默认的股票存储管理器"""
     global _default_storage
     if _default_storage is not None:
-        _default_storage.close()
+        _default_storage.close_all()
         _default_storage = None